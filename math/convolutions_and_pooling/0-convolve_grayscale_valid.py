@@ -2,14 +2,17 @@
 """Valid convolution on grayscale images"""
 
 import numpy as np
+separable_factors = __import__('separable').separable_factors
+convolve_separable = __import__('separable').convolve_separable
 
 
-def convolve_grayscale_valid(images, kernel):
+def convolve_grayscale_valid(images, kernel, separable=True):
     """
     Performs a valid convolution on grayscale images.
 
     images: numpy.ndarray of shape (m, h, w)
     kernel: numpy.ndarray of shape (kh, kw)
+    separable: whether to run rank-1 kernels as two 1D passes
 
     Returns: numpy.ndarray of shape (m, h - kh + 1, w - kw + 1)
     """
@@ -21,6 +24,11 @@ def convolve_grayscale_valid(images, kernel):
     output_h = h - kh + 1
     output_w = w - kw + 1
 
+    if separable:
+        factors = separable_factors(kernel)
+        if factors is not None:
+            return convolve_separable(images, *factors, output_h, output_w)
+
     # Initialize output
     output = np.zeros((m, output_h, output_w))
 
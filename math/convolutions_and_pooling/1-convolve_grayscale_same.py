@@ -2,11 +2,15 @@
 """Same convolution on grayscale images"""
 
 import numpy as np
+separable_factors = __import__('separable').separable_factors
+convolve_separable = __import__('separable').convolve_separable
 
 
-def convolve_grayscale_same(images, kernel):
+def convolve_grayscale_same(images, kernel, separable=True):
     """
     Performs a same convolution on grayscale images
+
+    separable: whether to run rank-1 kernels as two 1D passes
     """
 
     m, h, w = images.shape
@@ -26,6 +30,11 @@ def convolve_grayscale_same(images, kernel):
         mode='constant'
     )
 
+    if separable:
+        factors = separable_factors(kernel)
+        if factors is not None:
+            return convolve_separable(padded, *factors, h, w)
+
     output = np.zeros((m, h, w))
 
     # Only two loops allowed
@@ -2,9 +2,11 @@
 """Module for performing grayscale convolution with custom padding."""
 
 import numpy as np
+separable_factors = __import__('separable').separable_factors
+convolve_separable = __import__('separable').convolve_separable
 
 
-def convolve_grayscale_padding(images, kernel, padding):
+def convolve_grayscale_padding(images, kernel, padding, separable=True):
     """
     Performs a convolution on grayscale images with custom padding.
 
@@ -18,6 +20,9 @@ def convolve_grayscale_padding(images, kernel, padding):
         kh is the height of the kernel, kw is the width of the kernel.
     padding : tuple
         Tuple of (ph, pw) representing the padding for height and width.
+    separable : bool, optional
+        Whether to detect rank-1 kernels (SVD rank check) and run them
+        as two 1D passes. Default is True.
 
     Returns
     -------
@@ -38,6 +43,11 @@ def convolve_grayscale_padding(images, kernel, padding):
     h_out = h + 2 * ph - kh + 1
     w_out = w + 2 * pw - kw + 1
 
+    if separable:
+        factors = separable_factors(kernel)
+        if factors is not None:
+            return convolve_separable(images_padded, *factors, h_out, w_out)
+
     # Initialize output array
     output = np.zeros((m, h_out, w_out))
 
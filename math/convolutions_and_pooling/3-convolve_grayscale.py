@@ -2,9 +2,17 @@
 """Module for performing grayscale convolution with padding and stride."""
 
 import numpy as np
+separable_factors = __import__('separable').separable_factors
+convolve_separable = __import__('separable').convolve_separable
+convolve_fft = __import__('fft_convolve').convolve_fft
+pick_backend = __import__('fft_convolve').pick_backend
+box_filter = __import__('integral').box_filter
+use_integral = __import__('integral').use_integral
+compute_dtype = __import__('windows').compute_dtype
 
 
-def convolve_grayscale(images, kernel, padding='same', stride=(1, 1)):
+def convolve_grayscale(images, kernel, padding='same', stride=(1, 1),
+                       dtype=None, separable=True, method='auto'):
     """
     Performs a convolution on grayscale images with padding and stride.
 
@@ -22,6 +30,23 @@ def convolve_grayscale(images, kernel, padding='same', stride=(1, 1)):
     stride : tuple, optional
         Tuple (sh, sw) representing the stride along height and width.
         Default is (1, 1).
+    dtype : numpy.dtype, optional
+        dtype of the computation and the output. Default is None, which
+        keeps the floating dtype of the images (float32 stays float32)
+        and uses float64 for integer images.
+    separable : bool, optional
+        Whether to detect rank-1 kernels (SVD rank check) and run them
+        as two 1D passes. Default is True.
+    method : str, optional
+        - 'direct': sliding window (two 1D passes for separable kernels)
+        - 'fft'   : batched frequency-domain convolution
+        - 'box'   : summed-area table, O(1) per output (constant kernels
+          only)
+        - 'auto'  : 'box' for constant kernels whose windows overlap
+          enough for it to be faster, otherwise whichever the cost model
+          in fft_convolve expects to be fastest for this image and kernel
+          size
+        Default is 'auto'.
 
     Returns
     -------
@@ -32,6 +57,10 @@ def convolve_grayscale(images, kernel, padding='same', stride=(1, 1)):
     kh, kw = kernel.shape
     sh, sw = stride
 
+    dtype = compute_dtype(images.dtype, dtype)
+    images = images.astype(dtype, copy=False)
+    kernel = kernel.astype(dtype, copy=False)
+
     # Determine padding
     if isinstance(padding, tuple):
         ph, pw = padding
@@ -59,8 +88,33 @@ def convolve_grayscale(images, kernel, padding='same', stride=(1, 1)):
     h_out = ((h + 2 * ph - kh) // sh) + 1
     w_out = ((w + 2 * pw - kw) // sw) + 1
 
+    box = np.all(kernel == kernel.flat[0])
+    if method == 'auto' and box and use_integral(kh, kw, sh, sw):
+        method = 'box'
+
+    if method == 'box':
+        if not box:
+            raise ValueError("method 'box' needs a constant kernel")
+        return box_filter(images_padded, kernel.flat[0], kh, kw, h_out,
+                          w_out, stride, dtype)
+
+    factors = separable_factors(kernel) if separable else None
+
+    if method == 'auto':
+        method = pick_backend(m, images_padded.shape[1:], (kh, kw),
+                              (h_out, w_out), factors is not None)
+    elif method not in ('direct', 'fft'):
+        raise ValueError("method must be 'auto', 'direct', 'fft' or 'box'")
+
+    if method == 'fft':
+        return convolve_fft(images_padded, kernel, h_out, w_out, stride,
+                            dtype)
+    if factors is not None:
+        return convolve_separable(images_padded, *factors, h_out, w_out,
+                                  stride, dtype)
+
     # Initialize output
-    output = np.zeros((m, h_out, w_out))
+    output = np.zeros((m, h_out, w_out), dtype=dtype)
 
     # Perform convolution (2 loops only)
     for i in range(h_out):
@@ -2,9 +2,11 @@
 """Module for performing multi-channel convolution with padding and stride."""
 
 import numpy as np
+compute_dtype = __import__('windows').compute_dtype
 
 
-def convolve_channels(images, kernel, padding='same', stride=(1, 1)):
+def convolve_channels(images, kernel, padding='same', stride=(1, 1),
+                      dtype=None):
     """
     Performs a convolution on multi-channel images with padding and stride.
 
@@ -22,6 +24,10 @@ def convolve_channels(images, kernel, padding='same', stride=(1, 1)):
     stride : tuple, optional
         Tuple (sh, sw) representing the stride along height and width.
         Default is (1, 1).
+    dtype : numpy.dtype, optional
+        dtype of the computation and the output. Default is None, which
+        keeps the floating dtype of the images (float32 stays float32)
+        and uses float64 for integer images.
 
     Returns
     -------
@@ -33,6 +39,10 @@ def convolve_channels(images, kernel, padding='same', stride=(1, 1)):
     kh, kw, kc = kernel.shape
     sh, sw = stride
 
+    dtype = compute_dtype(images.dtype, dtype)
+    images = images.astype(dtype, copy=False)
+    kernel = kernel.astype(dtype, copy=False)
+
     if kc != c:
         raise ValueError("Kernel channels must match image channels")
 
@@ -61,7 +71,7 @@ def convolve_channels(images, kernel, padding='same', stride=(1, 1)):
     w_out = ((w + 2 * pw - kw) // sw) + 1
 
     # Initialize output
-    output = np.zeros((m, h_out, w_out))
+    output = np.zeros((m, h_out, w_out), dtype=dtype)
 
     # Perform convolution (2 loops only)
     for i in range(h_out):
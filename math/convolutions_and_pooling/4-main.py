@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+import numpy as np
+convolve_channels = __import__('4-convolve_channels').convolve_channels
+convolve = __import__('5-convolve').convolve
+
+np.random.seed(0)
+images = np.random.randn(3, 17, 14, 3)
+kernel = np.random.randn(3, 4, 3)
+for stride in ((1, 1), (2, 1), (2, 3)):
+    for padding in ('same', 'valid', (2, 1)):
+        output = convolve_channels(images, kernel, padding, stride)
+        # A single kernel through convolve gives the same result
+        expected = convolve(images, kernel[..., np.newaxis], padding,
+                            stride)[..., 0]
+        print(stride, padding, output.shape, np.allclose(output, expected))
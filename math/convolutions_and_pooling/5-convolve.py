@@ -2,9 +2,13 @@
 """Module for performing multi-kernel convolution on images."""
 
 import numpy as np
+strided_windows = __import__('windows').strided_windows
+batch_chunk = __import__('windows').batch_chunk
+compute_dtype = __import__('windows').compute_dtype
 
 
-def convolve(images, kernels, padding='same', stride=(1, 1)):
+def convolve(images, kernels, padding='same', stride=(1, 1), dtype=None,
+             groups=1, window_bytes=None):
     """
     Performs a convolution on images using multiple kernels.
 
@@ -13,7 +17,8 @@ def convolve(images, kernels, padding='same', stride=(1, 1)):
     images : numpy.ndarray
         Array of shape (m, h, w, c) containing multiple images.
     kernels : numpy.ndarray
-        Array of shape (kh, kw, c, nc) containing the convolution kernels.
+        Array of shape (kh, kw, c // groups, nc) containing the
+        convolution kernels.
     padding : tuple, 'same', or 'valid', optional
         'same'  : output size same as input size.
         'valid' : no padding.
@@ -22,6 +27,20 @@ def convolve(images, kernels, padding='same', stride=(1, 1)):
     stride : tuple, optional
         Tuple (sh, sw) representing the stride along height and width.
         Default is (1, 1).
+    dtype : numpy.dtype, optional
+        dtype of the computation and the output. Default is None, which
+        keeps the floating dtype of the images (float32 stays float32)
+        and uses float64 for integer images.
+    groups : int, optional
+        Number of channel groups. The channels and the kernels are split
+        into groups, and output channels g * nc // groups to
+        (g + 1) * nc // groups only see input channels g * c // groups to
+        (g + 1) * c // groups. groups=c is a depthwise convolution.
+        Default is 1 (dense convolution).
+    window_bytes : int, optional
+        Bytes of window tensor copied by one einsum; the batch, then the
+        output rows of an image, are split to stay within it. Default is
+        WINDOW_BYTES.
 
     Returns
     -------
@@ -33,7 +52,13 @@ def convolve(images, kernels, padding='same', stride=(1, 1)):
     kh, kw, kc, nc = kernels.shape
     sh, sw = stride
 
-    if kc != c:
+    dtype = compute_dtype(images.dtype, dtype)
+    images = images.astype(dtype, copy=False)
+    kernels = kernels.astype(dtype, copy=False)
+
+    if c % groups or nc % groups:
+        raise ValueError("groups must divide the image and kernel channels")
+    if kc != c // groups:
         raise ValueError("Kernel channels must match image channels")
 
     # Determine padding
@@ -60,18 +85,34 @@ def convolve(images, kernels, padding='same', stride=(1, 1)):
     h_out = ((h + 2 * ph - kh) // sh) + 1
     w_out = ((w + 2 * pw - kw) // sw) + 1
 
-    # Initialize output
-    output = np.zeros((m, h_out, w_out, nc))
+    # Windows (m, h_out, w_out, groups, c // groups, kh, kw) are copied
+    # once into a reused buffer of unfolded patches and multiplied with
+    # the kernels of each group, a chunk of images at a time, or a chunk
+    # of output rows when a single image does not fit, so the copied
+    # windows stay within window_bytes
+    windows = strided_windows(images_padded, kh, kw, sh, sw, h_out, w_out)
+    windows = windows.reshape(m, h_out, w_out, groups, kc, kh, kw)
+    gc, gn = kc * kh * kw, nc // groups
+    grouped = kernels.reshape(kh, kw, kc, groups, gn).transpose(3, 2, 0, 1, 4)
+    grouped = np.ascontiguousarray(grouped).reshape(groups, gc, gn)
+    output = np.empty((m, h_out, w_out, groups, gn), dtype=dtype)
+
+    row_bytes = w_out * c * kh * kw * output.itemsize
+    rows = batch_chunk(h_out, row_bytes, window_bytes)
+    chunk = 1
+    if rows == h_out:
+        chunk = batch_chunk(m, h_out * row_bytes, window_bytes)
+    cols = np.empty((chunk * rows * w_out, groups, gc), dtype=dtype)
 
-    # Perform convolution (3 loops: height, width, kernels)
-    for i in range(h_out):
-        for j in range(w_out):
-            for k in range(nc):
-                patch = images_padded[
-                    :, i*sh:i*sh + kh, j*sw:j*sw + kw, :
-                ]
-                # Sum over height, width, channels
-                output[:, i, j, k] = np.sum(patch * kernels[:, :, :, k],
-                                            axis=(1, 2, 3))
+    for start in range(0, m, chunk):
+        for row in range(0, h_out, rows):
+            patches = windows[start:start + chunk, row:row + rows]
+            n = patches.shape[0] * patches.shape[1] * w_out
+            np.copyto(cols[:n].reshape(patches.shape), patches)
+            # Contiguous: either whole images or rows of a single image
+            out = output[start:start + chunk, row:row + rows]
+            out = out.reshape(n, groups, gn)
+            for g in range(groups):
+                np.matmul(cols[:n, g], grouped[g], out=out[:, g])
 
-    return output
+    return output.reshape(m, h_out, w_out, nc)
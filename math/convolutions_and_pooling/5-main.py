@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import numpy as np
+convolve = __import__('5-convolve').convolve
+
+
+def convolve_loop(images, kernels, padding, stride, groups=1):
+    """Reference: the loop convolution convolve replaced"""
+    m, h, w, c = images.shape
+    kh, kw, kc, nc = kernels.shape
+    sh, sw = stride
+    if isinstance(padding, tuple):
+        ph, pw = padding
+    elif padding == 'same':
+        ph = -(-((h - 1) * sh + kh - h) // 2)
+        pw = -(-((w - 1) * sw + kw - w) // 2)
+    else:
+        ph, pw = 0, 0
+    padded = np.pad(images, ((0, 0), (ph, ph), (pw, pw), (0, 0)))
+    h_out = (h + 2 * ph - kh) // sh + 1
+    w_out = (w + 2 * pw - kw) // sw + 1
+    gn = nc // groups
+
+    output = np.zeros((m, h_out, w_out, nc))
+    for i in range(h_out):
+        for j in range(w_out):
+            for k in range(nc):
+                g = k // gn
+                patch = padded[:, i * sh:i * sh + kh, j * sw:j * sw + kw,
+                               g * kc:(g + 1) * kc]
+                output[:, i, j, k] = np.sum(patch * kernels[..., k],
+                                            axis=(1, 2, 3))
+
+    return output
+
+
+np.random.seed(0)
+images = np.random.randn(3, 17, 14, 6)
+for groups in (1, 2, 3, 6):
+    kernels = np.random.randn(3, 4, 6 // groups, 6)
+    for stride in ((1, 1), (2, 1), (2, 3)):
+        for padding in ('same', 'valid', (2, 1)):
+            expected = convolve_loop(images, kernels, padding, stride, groups)
+            # window_bytes=1 unfolds a single output row at a time
+            for window_bytes in (None, 1):
+                output = convolve(images, kernels, padding, stride,
+                                  groups=groups, window_bytes=window_bytes)
+                assert np.allclose(output, expected), (groups, stride,
+                                                       padding, window_bytes)
+    print("groups={}: all strides and paddings match".format(groups))
+
+# Enough images for several chunks of WINDOW_BYTES
+images = np.random.randn(40, 64, 64, 8)
+kernels = np.random.randn(3, 3, 8, 2)
+output = convolve(images, kernels, 'same', (1, 1))
+print(output.shape, np.allclose(output, convolve_loop(images, kernels, 'same',
+                                                      (1, 1))))
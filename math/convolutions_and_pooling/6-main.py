@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import numpy as np
+pool = __import__('6-pool').pool
+
+
+def pool_loop(images, kernel_shape, stride, mode):
+    """Reference: the loop pooling pool replaced"""
+    m, h, w, c = images.shape
+    kh, kw = kernel_shape
+    sh, sw = stride
+    h_out = (h - kh) // sh + 1
+    w_out = (w - kw) // sw + 1
+    reduce = np.max if mode == 'max' else np.mean
+
+    output = np.zeros((m, h_out, w_out, c))
+    for i in range(h_out):
+        for j in range(w_out):
+            patch = images[:, i * sh:i * sh + kh, j * sw:j * sw + kw]
+            output[:, i, j] = reduce(patch, axis=(1, 2))
+
+    return output
+
+
+METHODS = {'max': ('auto', 'window', 'running'),
+           'avg': ('auto', 'window', 'integral')}
+
+np.random.seed(0)
+images = np.random.randn(3, 17, 14, 4)
+for mode, methods in METHODS.items():
+    for kernel_shape in ((2, 2), (3, 4), (5, 5)):
+        for stride in ((1, 1), (2, 1), (2, 3)):
+            expected = pool_loop(images, kernel_shape, stride, mode)
+            for method in methods:
+                output = pool(images, kernel_shape, stride, mode,
+                              method=method)
+                assert np.allclose(output, expected), (mode, kernel_shape,
+                                                       stride, method)
+    print("{}: all windows, strides and methods match".format(mode))
+
+# Enough images for several chunks of WINDOW_BYTES
+images = np.random.randn(40, 64, 64, 8)
+for mode in METHODS:
+    output = pool(images, (3, 3), (1, 1), mode, method='window')
+    print(mode, output.shape,
+          np.allclose(output, pool_loop(images, (3, 3), (1, 1), mode)))
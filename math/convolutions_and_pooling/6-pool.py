@@ -2,9 +2,17 @@
 """Module for performing max and average pooling on images."""
 
 import numpy as np
+strided_windows = __import__('windows').strided_windows
+batch_chunk = __import__('windows').batch_chunk
+compute_dtype = __import__('windows').compute_dtype
+box_sum = __import__('integral').box_sum
+use_integral = __import__('integral').use_integral
+running_max = __import__('running_max').running_max
+use_running = __import__('running_max').use_running
 
 
-def pool(images, kernel_shape, stride, mode='max'):
+def pool(images, kernel_shape, stride, mode='max', dtype=None,
+         method='auto'):
     """
     Performs pooling on images.
 
@@ -18,6 +26,19 @@ def pool(images, kernel_shape, stride, mode='max'):
         Tuple (sh, sw) representing the stride along height and width.
     mode : str, optional
         'max' for max pooling, 'avg' for average pooling. Default is 'max'.
+    dtype : numpy.dtype, optional
+        dtype of the computation and the output. Default is None, which
+        keeps the floating dtype of the images (float32 stays float32)
+        and uses float64 for integer images.
+    method : str, optional
+        - 'window'  : reduce every window directly
+        - 'integral': average from a float64 summed-area table, O(1) per
+          output whatever the window size ('avg' only)
+        - 'running' : van Herk/Gil-Werman running max over rows, then
+          columns, O(1) per output whatever the window size ('max' only)
+        - 'auto'    : 'integral' or 'running' when the windows overlap
+          enough for it to be faster, 'window' otherwise
+        Default is 'auto'.
 
     Returns
     -------
@@ -28,24 +49,53 @@ def pool(images, kernel_shape, stride, mode='max'):
     kh, kw = kernel_shape
     sh, sw = stride
 
+    dtype = compute_dtype(images.dtype, dtype)
+    images = images.astype(dtype, copy=False)
+
     # Compute output dimensions
     h_out = (h - kh) // sh + 1
     w_out = (w - kw) // sw + 1
 
-    # Initialize output
-    output = np.zeros((m, h_out, w_out, c))
-
-    # Perform pooling (2 loops only)
-    for i in range(h_out):
-        for j in range(w_out):
-            patch = images[
-                :, i*sh:i*sh + kh, j*sw:j*sw + kw, :
-            ]
-            if mode == 'max':
-                output[:, i, j, :] = np.max(patch, axis=(1, 2))
-            elif mode == 'avg':
-                output[:, i, j, :] = np.mean(patch, axis=(1, 2))
-            else:
-                raise ValueError("mode must be 'max' or 'avg'")
+    if mode == 'max':
+        reduce = np.max
+    elif mode == 'avg':
+        reduce = np.mean
+    else:
+        raise ValueError("mode must be 'max' or 'avg'")
+
+    if method == 'auto':
+        method = 'window'
+        if mode == 'avg' and use_integral(kh, kw, sh, sw):
+            method = 'integral'
+        elif mode == 'max' and use_running(kh, kw, sh, sw):
+            method = 'running'
+    elif method not in ('window', 'integral', 'running'):
+        raise ValueError(
+            "method must be 'auto', 'window', 'integral' or 'running'"
+        )
+
+    if method == 'running':
+        if mode != 'max':
+            raise ValueError("method 'running' only supports mode 'max'")
+        rows = running_max(images, kw, axis=2, stride=sw)
+
+        return running_max(rows, kh, axis=1, stride=sh)
+
+    if method == 'integral':
+        if mode != 'avg':
+            raise ValueError("method 'integral' only supports mode 'avg'")
+        total = box_sum(images, kh, kw, h_out, w_out, stride)
+        total /= kh * kw
+
+        return total.astype(dtype, copy=False)
+
+    # One reduction over the window axes per chunk of images
+    windows = strided_windows(images, kh, kw, sh, sw, h_out, w_out)
+    output = np.empty((m, h_out, w_out, c), dtype=dtype)
+    chunk = batch_chunk(m, h_out * w_out * c * kh * kw * output.itemsize)
+
+    for start in range(0, m, chunk):
+        reduce(windows[start:start + chunk], axis=(4, 5),
+               out=output[start:start + chunk])
 
     return output
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Module for summed-area-table (integral image) window sums."""
+
+import numpy as np
+
+# The integral image costs about the same whatever the window, while a
+# direct window sum costs kh * kw / (sh * sw) taps per input pixel: the
+# integral image wins from about this many taps per pixel on our CPUs
+INTEGRAL_MIN_OVERLAP = 8
+
+
+def use_integral(kh, kw, sh, sw):
+    """
+    Whether a window sum is cheaper through the integral image.
+
+    Parameters
+    ----------
+    kh, kw : int
+        Window height and width.
+    sh, sw : int
+        Stride along height and width.
+
+    Returns
+    -------
+    bool
+        True if the windows overlap by at least INTEGRAL_MIN_OVERLAP
+        taps per input pixel.
+    """
+    return kh * kw >= INTEGRAL_MIN_OVERLAP * sh * sw
+
+
+def integral_image(images):
+    """
+    Computes the summed-area table of a batch of images in float64.
+
+    Parameters
+    ----------
+    images : numpy.ndarray
+        Array of shape (m, h, w) or (m, h, w, c).
+
+    Returns
+    -------
+    numpy.ndarray
+        float64 array of shape (m, h + 1, w + 1) or (m, h + 1, w + 1, c)
+        where S[:, i, j] is the sum of images[:, :i, :j]. Accumulating
+        in float64 keeps the rounding drift of large tables small.
+    """
+    m, h, w = images.shape[:3]
+    S = np.zeros((m, h + 1, w + 1) + images.shape[3:], dtype=np.float64)
+    np.cumsum(images, axis=1, dtype=np.float64, out=S[:, 1:, 1:])
+    np.cumsum(S[:, 1:, 1:], axis=2, out=S[:, 1:, 1:])
+
+    return S
+
+
+def box_sum(images, kh, kw, h_out, w_out, stride=(1, 1)):
+    """
+    Sums every kh x kw window of a batch in O(1) per output.
+
+    Parameters
+    ----------
+    images : numpy.ndarray
+        Array of shape (m, h, w) or (m, h, w, c), already padded.
+    kh, kw : int
+        Window height and width.
+    h_out, w_out : int
+        Output height and width.
+    stride : tuple, optional
+        Tuple (sh, sw) representing the stride along height and width.
+        Default is (1, 1).
+
+    Returns
+    -------
+    numpy.ndarray
+        float64 array of shape (m, h_out, w_out) or (m, h_out, w_out, c)
+        containing the window sums.
+    """
+    sh, sw = stride
+    S = integral_image(images)
+    top = slice(0, sh * (h_out - 1) + 1, sh)
+    bottom = slice(kh, kh + sh * (h_out - 1) + 1, sh)
+    left = slice(0, sw * (w_out - 1) + 1, sw)
+    right = slice(kw, kw + sw * (w_out - 1) + 1, sw)
+
+    total = S[:, bottom, right] - S[:, top, right]
+    total -= S[:, bottom, left]
+    total += S[:, top, left]
+
+    return total
+
+
+def box_filter(images_padded, value, kh, kw, h_out, w_out, stride=(1, 1),
+               dtype=None):
+    """
+    Convolves padded images with a constant kh x kw kernel.
+
+    Parameters
+    ----------
+    images_padded : numpy.ndarray
+        Array of shape (m, h_pad, w_pad) containing the padded images.
+    value : float
+        Value of every tap of the kernel.
+    kh, kw : int
+        Kernel height and width.
+    h_out, w_out : int
+        Output height and width.
+    stride : tuple, optional
+        Tuple (sh, sw) representing the stride along height and width.
+        Default is (1, 1).
+    dtype : numpy.dtype, optional
+        dtype of the output. Default is the dtype of the images.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (m, h_out, w_out) containing the convolved images.
+    """
+    if dtype is None:
+        dtype = images_padded.dtype
+    total = box_sum(images_padded, kh, kw, h_out, w_out, stride)
+    total *= value
+
+    return total.astype(dtype, copy=False)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Benchmark of the max-pooling methods behind pool(method='auto').
+
+Run `./pool_benchmark.py` to time the direct window max against the
+running max over a grid of windows and strides, and to check which
+one auto picks. Rows where auto does not pick the faster method are
+flagged; RUNNING_MIN_OVERLAP in running_max.py sets the crossover.
+"""
+
+import argparse
+import time
+import numpy as np
+pool = __import__('6-pool').pool
+use_running = __import__('running_max').use_running
+
+CASES = [
+    # (window side, stride)
+    (2, 1), (2, 2), (3, 1), (3, 2), (3, 3), (4, 1), (4, 2), (4, 3),
+    (5, 1), (5, 2), (5, 3), (7, 1), (7, 2), (7, 3), (9, 2), (9, 3)
+]
+
+
+def time_op(fn, repeat=5):
+    """
+    Best wall time of fn() over `repeat` runs, after one warm-up run.
+
+    Parameters
+    ----------
+    fn : callable
+        Function without arguments.
+    repeat : int, optional
+        Number of timed runs. Default is 5.
+
+    Returns
+    -------
+    float
+        Time in seconds.
+    """
+    fn()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def bench_pool(images, k, s, repeat=5):
+    """
+    Times both max-pooling methods on one window and checks they agree.
+
+    Parameters
+    ----------
+    images : numpy.ndarray
+        Array of shape (m, h, w, c) containing the images.
+    k : int
+        Side of the square window.
+    s : int
+        Stride along height and width.
+    repeat : int, optional
+        Number of timed runs. Default is 5.
+
+    Returns
+    -------
+    dict
+        Time of each method in seconds and the method auto picks.
+    """
+    window = pool(images, (k, k), (s, s), method='window')
+    running = pool(images, (k, k), (s, s), method='running')
+    if not np.array_equal(window, running):
+        raise AssertionError("running max differs from the window max")
+
+    return {
+        'window': time_op(lambda: pool(images, (k, k), (s, s),
+                                       method='window'), repeat),
+        'running': time_op(lambda: pool(images, (k, k), (s, s),
+                                        method='running'), repeat),
+        'auto': 'running' if use_running(k, k, s, s) else 'window'
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--shape', type=int, nargs=4,
+                        default=(8, 128, 128, 16),
+                        metavar=('M', 'H', 'W', 'C'),
+                        help="shape of the image batch")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="timed runs per measurement (best is kept)")
+    args = parser.parse_args()
+
+    images = np.random.default_rng(0).standard_normal(args.shape)
+    print("{:>6} {:>6} {:>8} {:>11} {:>12} {:>8}".format(
+        'window', 'stride', 'taps/px', 'window (ms)', 'running (ms)', 'auto'
+    ))
+    for k, s in CASES:
+        row = bench_pool(images, k, s, args.repeat)
+        faster = min(('window', 'running'), key=row.get)
+        print("{:>6} {:>6} {:>8.2f} {:>11.1f} {:>12.1f} {:>8}{}".format(
+            '{0}x{0}'.format(k), s, k * k / (s * s), row['window'] * 1e3,
+            row['running'] * 1e3, row['auto'],
+            '' if faster == row['auto'] else '  (slower)'
+        ))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Module for van Herk/Gil-Werman sliding-window maxima.
+
+supervised_learning/cnn/pool_running_max.py holds a second copy of
+running_max, which takes its buffers from a cnn Workspace. Every project
+directory is self-contained: its scripts import their siblings with
+__import__ from that directory, so neither copy can load the other. Any
+fix to running_max must be made in both files.
+"""
+
+import numpy as np
+
+# The running max costs about the same per input pixel whatever the
+# window and stride, while a direct window max costs kh * kw / (sh * sw)
+# taps per input pixel. Below about this many taps the window max wins
+# or ties on some of our CPUs (2x2 stride 1, 3x3 and 4x4 stride 2), so
+# auto keeps it there; pool_benchmark.py measures the crossover
+RUNNING_MIN_OVERLAP = 8
+
+
+def use_running(kh, kw, sh, sw):
+    """
+    Whether a window max is cheaper through the running max.
+
+    Parameters
+    ----------
+    kh, kw : int
+        Window height and width.
+    sh, sw : int
+        Stride along height and width.
+
+    Returns
+    -------
+    bool
+        True if the windows overlap by at least RUNNING_MIN_OVERLAP taps
+        per input pixel.
+    """
+    return kh * kw >= RUNNING_MIN_OVERLAP * sh * sw
+
+
+def running_max(x, k, axis, stride=1):
+    """
+    Maximum of every k-long window along one axis (van Herk/Gil-Werman).
+
+    The axis is cut into blocks of k. Within each block a forward and a
+    backward cumulative maximum are taken; a window starting at i spans
+    the end of one block and the start of the next, so its maximum is
+    max(backward[i], forward[i + k - 1]).
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        Input array.
+    k : int
+        Window length.
+    axis : int
+        Axis to slide the window along.
+    stride : int, optional
+        Step between windows. Default is 1.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array like x with (n - k) // stride + 1 elements along axis.
+    """
+    axis %= x.ndim
+    n = x.shape[axis]
+    n_out = (n - k) // stride + 1
+    blocks = -(-n // k)
+    before, after = x.shape[:axis], x.shape[axis + 1:]
+
+    if np.issubdtype(x.dtype, np.floating):
+        lowest = -np.inf
+    else:
+        lowest = np.iinfo(x.dtype).min
+    padded = np.full(before + (blocks, k) + after, lowest, dtype=x.dtype)
+    flat = padded.reshape(before + (blocks * k,) + after)
+    flat[(slice(None),) * axis + (slice(0, n),)] = x
+
+    # Cumulative maxima inside each block, forwards into a copy and
+    # backwards in place; k strided passes beat ufunc.accumulate here
+    forward = padded.copy()
+    lead = (slice(None),) * (axis + 1)
+    for j in range(1, k):
+        np.maximum(forward[lead + (j - 1,)], forward[lead + (j,)],
+                   out=forward[lead + (j,)])
+    for j in range(k - 2, -1, -1):
+        np.maximum(padded[lead + (j + 1,)], padded[lead + (j,)],
+                   out=padded[lead + (j,)])
+    forward = forward.reshape(flat.shape)
+    backward = flat
+
+    last = stride * (n_out - 1) + 1
+    lead = (slice(None),) * axis
+
+    return np.maximum(backward[lead + (slice(0, last, stride),)],
+                      forward[lead + (slice(k - 1, k - 1 + last, stride),)])
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Module for separable (rank-1) kernel convolution."""
+
+import numpy as np
+
+
+def separable_factors(kernel, rtol=1e-6):
+    """
+    Splits a rank-1 kernel into a column and a row vector.
+
+    Parameters
+    ----------
+    kernel : numpy.ndarray
+        Array of shape (kh, kw) containing the kernel.
+    rtol : float, optional
+        The kernel is treated as rank 1 when its second singular value
+        is at most rtol times the first. Default is 1e-6.
+
+    Returns
+    -------
+    tuple or None
+        (col, row) of shapes (kh,) and (kw,) with
+        kernel ~= numpy.outer(col, row), or None if the kernel is not
+        separable.
+    """
+    u, s, vt = np.linalg.svd(np.asarray(kernel, dtype=np.float64))
+
+    if s[0] == 0 or (len(s) > 1 and s[1] > rtol * s[0]):
+        return None
+
+    scale = np.sqrt(s[0])
+
+    return u[:, 0] * scale, vt[0] * scale
+
+
+def convolve_separable(images_padded, col, row, h_out, w_out,
+                       stride=(1, 1), dtype=None):
+    """
+    Convolves padded grayscale images with outer(col, row) in two passes.
+
+    A vertical 1D pass over kh taps followed by a horizontal 1D pass
+    over kw taps costs O(kh + kw) per pixel instead of O(kh * kw).
+
+    Parameters
+    ----------
+    images_padded : numpy.ndarray
+        Array of shape (m, h_pad, w_pad) containing the padded images.
+    col : numpy.ndarray
+        Array of shape (kh,), the vertical factor of the kernel.
+    row : numpy.ndarray
+        Array of shape (kw,), the horizontal factor of the kernel.
+    h_out, w_out : int
+        Output height and width.
+    stride : tuple, optional
+        Tuple (sh, sw) representing the stride along height and width.
+        Default is (1, 1).
+    dtype : numpy.dtype, optional
+        dtype of the output. Default is the result type of the inputs.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (m, h_out, w_out) containing the convolved images.
+    """
+    m, _, w_pad = images_padded.shape
+    sh, sw = stride
+
+    if dtype is None:
+        dtype = np.result_type(images_padded, col, row)
+    col = col.astype(dtype, copy=False)
+    row = row.astype(dtype, copy=False)
+
+    # Vertical pass: only the rows the strided output needs
+    rows = np.zeros((m, h_out, w_pad), dtype=dtype)
+    for p in range(len(col)):
+        rows += col[p] * images_padded[:, p:p + sh * (h_out - 1) + 1:sh, :]
+
+    # Horizontal pass
+    output = np.zeros((m, h_out, w_out), dtype=dtype)
+    for q in range(len(row)):
+        output += row[q] * rows[:, :, q:q + sw * (w_out - 1) + 1:sw]
+
+    return output
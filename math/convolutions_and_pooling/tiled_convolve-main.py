@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import tracemalloc
+import numpy as np
+convolve_tiled = __import__('tiled_convolve').convolve_tiled
+convolve_channels = __import__('4-convolve_channels').convolve_channels
+convolve = __import__('5-convolve').convolve
+
+np.random.seed(0)
+images = np.random.randn(1, 300, 400, 3)
+
+with tempfile.TemporaryDirectory() as folder:
+    src = os.path.join(folder, 'images.npy')
+    out_path = os.path.join(folder, 'out.npy')
+    np.save(src, images)
+
+    for tile_bytes in (2 ** 20, 8 * 2 ** 20):
+        for kernel in (np.random.randn(3, 3, 3, 8),
+                       np.random.randn(7, 7, 3, 8),
+                       np.random.randn(5, 5, 3)):
+            tracemalloc.start()
+            out = convolve_tiled(src, kernel, out_path,
+                                 tile_bytes=tile_bytes)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            if kernel.ndim == 3:
+                expected = convolve_channels(images, kernel)
+            else:
+                expected = convolve(images, kernel)
+            print("tile_bytes {:>4.1f} MiB, kernel {}: peak {:.3f} MiB, "
+                  "matches: {}".format(tile_bytes / 2 ** 20, kernel.shape,
+                                       peak / 2 ** 20,
+                                       np.allclose(out, expected)))
+            # The budget bounds everything the tiles allocate
+            assert peak <= tile_bytes
+            del out
+
+    # 32 workers leave each tile 32 KiB of a 1 MiB budget: too small
+    try:
+        convolve_tiled(src, np.random.randn(3, 3, 3, 8), out_path,
+                       tile_bytes=2 ** 20, workers=32)
+    except ValueError as e:
+        print("workers 32:", e)
+    else:
+        raise AssertionError("a budget too small for a tile must raise")
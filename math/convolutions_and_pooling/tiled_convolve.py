@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Module for tiled, memory-mapped convolution of out-of-core images."""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+convolve_channels = __import__('4-convolve_channels').convolve_channels
+convolve = __import__('5-convolve').convolve
+compute_dtype = __import__('windows').compute_dtype
+
+# Bytes of a tile's working set that are not arrays (memory maps, views
+# and other Python objects), set aside from the budget of every tile
+TILE_OVERHEAD = 64 * 2 ** 10
+
+
+def npy_layout(path):
+    """
+    Reads the layout of a .npy file without loading it.
+
+    Parameters
+    ----------
+    path : str
+        Path to the .npy file.
+
+    Returns
+    -------
+    tuple
+        (shape, dtype, offset) where offset is the size of the header
+        in bytes.
+    """
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            header = np.lib.format.read_array_header_1_0(f)
+        else:
+            header = np.lib.format.read_array_header_2_0(f)
+        shape, fortran_order, dtype = header
+        if fortran_order:
+            raise ValueError("Fortran-ordered .npy files are not supported")
+
+        return shape, dtype, f.tell()
+
+
+def read_rows(src, layout, n, r0, r1):
+    """
+    Maps rows r0:r1 of image n of a (m, h, w, c) source.
+
+    Only this band is mapped, so the pages touched while reading a
+    tile are released as soon as the returned array is dropped.
+
+    Parameters
+    ----------
+    src : str or numpy.ndarray
+        Path to the .npy file, or an in-memory array.
+    layout : tuple or None
+        (shape, dtype, offset) of the .npy file, None for arrays.
+    n : int
+        Image index.
+    r0, r1 : int
+        Row range.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (r1 - r0, w, c).
+    """
+    if layout is None:
+        return src[n, r0:r1]
+
+    (_, h, w, c), dtype, offset = layout
+    row_bytes = w * c * dtype.itemsize
+
+    return np.memmap(src, dtype=dtype, mode='r',
+                     offset=offset + (n * h + r0) * row_bytes,
+                     shape=(r1 - r0, w, c))
+
+
+def tile_side(budget, c, nc, kh, kw, sh, sw, itemsize):
+    """
+    Largest square output tile whose working set fits in a budget.
+
+    Parameters
+    ----------
+    budget : int
+        Bytes available to one tile.
+    c, nc : int
+        Input and output channels.
+    kh, kw : int
+        Kernel height and width.
+    sh, sw : int
+        Stride along height and width.
+    itemsize : int
+        Bytes per element.
+
+    Returns
+    -------
+    int
+        Side of the output tile, at least 1.
+
+    Raises
+    ------
+    ValueError
+        If the budget cannot hold a tile of one output pixel.
+    """
+    def working_set(t):
+        """Bytes of the padded input tile, its copy, the windows
+        convolve unfolds and the output"""
+        inputs = ((t - 1) * sh + kh) * ((t - 1) * sw + kw) * c
+        windows = t * t * kh * kw * c
+        return (2 * inputs + windows + 2 * t * t * nc) * itemsize
+
+    budget -= TILE_OVERHEAD
+    if budget < working_set(1):
+        raise ValueError(
+            "budget of {} bytes per tile is too small: a tile needs at "
+            "least {} bytes".format(budget + TILE_OVERHEAD,
+                                    TILE_OVERHEAD + working_set(1))
+        )
+    side = max(1, int(np.sqrt(
+        budget / ((2 * sh * sw * c + kh * kw * c + 2 * nc) * itemsize)
+    )))
+    while side > 1 and working_set(side) > budget:
+        side -= 1
+
+    return side
+
+
+def convolve_tiled(src, kernel, out_path, padding='same', stride=(1, 1),
+                   tile_bytes=256 * 2 ** 20, workers=1, dtype=None):
+    """
+    Convolves images that do not fit in RAM, tile by tile.
+
+    Each output tile reads its input rows plus the kernel halo from
+    the source, pads them where the tile touches the image border,
+    convolves them in memory and writes the result into a
+    memory-mapped .npy output.
+
+    Parameters
+    ----------
+    src : str or numpy.ndarray
+        Path to a .npy file (or an array, e.g. a numpy.memmap) of shape
+        (m, h, w, c).
+    kernel : numpy.ndarray
+        Array of shape (kh, kw, c) as in convolve_channels, or
+        (kh, kw, c, nc) as in convolve.
+    out_path : str
+        Path of the .npy file the output is written to.
+    padding : tuple, 'same', or 'valid', optional
+        Same meaning as in convolve. Default is 'same'.
+    stride : tuple, optional
+        Tuple (sh, sw) representing the stride along height and width.
+        Default is (1, 1).
+    tile_bytes : int, optional
+        Memory budget for the tiles in flight, shared by all workers.
+        Default is 256 MiB. ValueError is raised if the share of one
+        worker cannot hold a single tile.
+    workers : int, optional
+        Number of tiles processed in parallel. Default is 1.
+    dtype : numpy.dtype, optional
+        dtype of the computation and the output. Default is the
+        floating dtype of the images, float64 for integer images.
+
+    Returns
+    -------
+    numpy.memmap
+        Read-only map of the output, of shape (m, h_out, w_out) for a 3D
+        kernel or (m, h_out, w_out, nc) for a 4D kernel.
+    """
+    if isinstance(src, str):
+        layout = npy_layout(src)
+        shape, src_dtype = layout[0], layout[1]
+    else:
+        layout = None
+        shape, src_dtype = src.shape, src.dtype
+
+    m, h, w, c = shape
+    channels = kernel.ndim == 3
+    if channels:
+        kh, kw, kc = kernel.shape
+        nc = 1
+    else:
+        kh, kw, kc, nc = kernel.shape
+    sh, sw = stride
+
+    if kc != c:
+        raise ValueError("Kernel channels must match image channels")
+
+    dtype = compute_dtype(src_dtype, dtype)
+
+    # Determine padding
+    if isinstance(padding, tuple):
+        ph, pw = padding
+    elif padding == 'same':
+        ph_temp = (h - 1) * sh + kh - h
+        pw_temp = (w - 1) * sw + kw - w
+        ph = ph_temp // 2 + (ph_temp % 2 > 0)
+        pw = pw_temp // 2 + (pw_temp % 2 > 0)
+    elif padding == 'valid':
+        ph, pw = 0, 0
+    else:
+        raise ValueError("padding must be 'same', 'valid', or a tuple")
+
+    h_out = ((h + 2 * ph - kh) // sh) + 1
+    w_out = ((w + 2 * pw - kw) // sw) + 1
+    out_shape = (m, h_out, w_out) if channels else (m, h_out, w_out, nc)
+
+    out = np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype,
+                                    shape=out_shape)
+    del out
+    out_layout = npy_layout(out_path)
+    out_row = w_out * nc * dtype.itemsize
+
+    side = tile_side(tile_bytes // workers, c, nc, kh, kw, sh, sw,
+                     dtype.itemsize)
+    # The window tensor of a whole tile is part of its working set
+    window_bytes = side * side * kh * kw * c * dtype.itemsize
+    # Generated lazily: a list of small tiles would itself eat into
+    # the budget
+    tiles = (
+        (n, i0, min(i0 + side, h_out), j0, min(j0 + side, w_out))
+        for n in range(m)
+        for i0 in range(0, h_out, side)
+        for j0 in range(0, w_out, side)
+    )
+
+    def run(tile):
+        """Convolves one output tile and writes it to the output file"""
+        n, i0, i1, j0, j1 = tile
+
+        # Input window in padded coordinates, then in image coordinates
+        top, left = i0 * sh, j0 * sw
+        bottom, right = (i1 - 1) * sh + kh, (j1 - 1) * sw + kw
+        r0, r1 = max(top - ph, 0), min(bottom - ph, h)
+        c0, c1 = max(left - pw, 0), min(right - pw, w)
+
+        window = np.zeros((1, bottom - top, right - left, c), dtype=dtype)
+        if r1 > r0 and c1 > c0:
+            rows = read_rows(src, layout, n, r0, r1)
+            window[0, r0 + ph - top:r1 + ph - top,
+                   c0 + pw - left:c1 + pw - left] = rows[:, c0:c1]
+            del rows
+
+        if channels:
+            result = convolve_channels(window, kernel, padding=(0, 0),
+                                       stride=stride, dtype=dtype)
+        else:
+            result = convolve(window, kernel, padding=(0, 0),
+                              stride=stride, dtype=dtype,
+                              window_bytes=window_bytes)
+
+        band = np.memmap(out_path, dtype=dtype, mode='r+',
+                         offset=out_layout[2] + (n * h_out + i0) * out_row,
+                         shape=(i1 - i0,) + out_shape[2:])
+        band[:, j0:j1] = result[0]
+        band.flush()
+        del band
+
+    if workers > 1:
+        # At most `workers` tiles submitted at once, as the budget
+        # assumes
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for tile in tiles:
+                if len(pending) == workers:
+                    pending.popleft().result()
+                pending.append(executor.submit(run, tile))
+            while pending:
+                pending.popleft().result()
+    else:
+        for tile in tiles:
+            run(tile)
+
+    return np.load(out_path, mmap_mode='r')
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Module for strided window views, batch chunking and the dtype policy."""
+
+import numpy as np
+
+# Largest window tensor (in bytes) materialized by one chunk of images
+WINDOW_BYTES = 64 * 2 ** 20
+
+
+def compute_dtype(images_dtype, dtype=None):
+    """
+    dtype a convolution or pooling computes and returns its output in.
+
+    Parameters
+    ----------
+    images_dtype : numpy.dtype
+        dtype of the images.
+    dtype : numpy.dtype, optional
+        dtype requested by the caller. Default is None.
+
+    Returns
+    -------
+    numpy.dtype
+        `dtype` when given, otherwise the floating dtype of the images
+        (float32 stays float32), and float64 for integer images.
+    """
+    if dtype is not None:
+        return np.dtype(dtype)
+    if np.issubdtype(images_dtype, np.floating):
+        return np.dtype(images_dtype)
+
+    return np.dtype(np.float64)
+
+
+def strided_windows(images, kh, kw, sh, sw, h_out, w_out):
+    """
+    Views every pooling or convolution window of a batch, without copying.
+
+    Parameters
+    ----------
+    images : numpy.ndarray
+        Array of shape (m, h, w, c) containing the (padded) images.
+    kh, kw : int
+        Window height and width.
+    sh, sw : int
+        Stride along height and width.
+    h_out, w_out : int
+        Output height and width.
+
+    Returns
+    -------
+    numpy.ndarray
+        Read-only view of shape (m, h_out, w_out, c, kh, kw).
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(
+        images, (kh, kw), axis=(1, 2)
+    )
+
+    return windows[:, :sh * (h_out - 1) + 1:sh, :sw * (w_out - 1) + 1:sw]
+
+
+def batch_chunk(m, image_bytes, budget=None):
+    """
+    Number of images (or rows) to process at once so a chunk fits in a
+    budget.
+
+    Parameters
+    ----------
+    m : int
+        Number of images (or rows).
+    image_bytes : int
+        Bytes of temporary memory needed per image (or row).
+    budget : int, optional
+        Bytes allowed per chunk. Default is WINDOW_BYTES.
+
+    Returns
+    -------
+    int
+        Chunk size along m, between 1 and m.
+    """
+    if budget is None:
+        budget = WINDOW_BYTES
+
+    return int(min(m, max(1, budget // max(image_bytes, 1))))
@@ -1,10 +1,152 @@
 #!/usr/bin/env python3
 """Convolutional forward propagation"""
 
+import weakref
 import numpy as np
+compute_dtype = __import__('dtypes').compute_dtype
+get_buffer = __import__('workspace').get_buffer
+pad_input = __import__('workspace').pad_input
+batch_slices = __import__('parallel').batch_slices
+map_shards = __import__('parallel').map_shards
+shard_caches = __import__('parallel').shard_caches
+shard_workspaces = __import__('parallel').shard_workspaces
 
+# Winograd F(2x2, 3x3) kernel transform matrix
+WINO_G = np.array([
+    [1.0, 0.0, 0.0],
+    [0.5, 0.5, 0.5],
+    [0.5, -0.5, 0.5],
+    [0.0, 0.0, 1.0]
+])
 
-def conv_forward(A_prev, W, b, activation, padding="same", stride=(1, 1)):
+# Below this many input channels the tile transforms cost more than
+# the multiplies Winograd saves, so "auto" stays on the GEMM path
+WINOGRAD_MIN_CHANNELS = 64
+
+# (id(W), dtype) -> (weak reference to W, copy of W, transformed W)
+_winograd_weights = {}
+
+
+def im2col(A_prev_pad, kh, kw, sh, sw):
+    """
+    Unfolds every kernel window of a padded batch
+
+    A_prev_pad: (m, h_pad, w_pad, c_prev) padded input
+    kh, kw: kernel height and width
+    sh, sw: stride along height and width
+
+    Returns:
+    Strided view of shape (m, h_out, w_out, c_prev, kh, kw)
+    (no data is copied until the view is contracted)
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(
+        A_prev_pad, (kh, kw), axis=(1, 2)
+    )
+
+    return windows[:, ::sh, ::sw]
+
+
+def winograd_weights(W, dtype=None):
+    """
+    Transforms 3x3 kernels into the Winograd F(2x2, 3x3) domain
+
+    W: (3, 3, c_prev, c_new)
+    dtype: dtype of the transformed kernels, W.dtype by default
+
+    Returns:
+    (16, c_prev, c_new) transformed kernels, G W G^T per channel pair;
+    the result is cached per W array and recomputed only when W is
+    modified in place
+    """
+    dtype = W.dtype if dtype is None else np.dtype(dtype)
+    key = (id(W), dtype)
+    entry = _winograd_weights.get(key)
+    if entry is not None:
+        ref, W_seen, U = entry
+        if ref() is W and np.array_equal(W_seen, W):
+            return U
+
+    U = np.einsum('ik,klcn,jl->ijcn', WINO_G, W, WINO_G, optimize=True)
+    U = U.reshape(16, W.shape[2], W.shape[3]).astype(dtype)
+
+    if entry is None:
+        weakref.finalize(W, _winograd_weights.pop, key, None)
+    _winograd_weights[key] = (weakref.ref(W), W.copy(), U)
+
+    return U
+
+
+def winograd_conv(A_prev, W, ph, pw, h_out, w_out, workspace=None):
+    """
+    Stride-1 3x3 convolution with Winograd minimal filtering
+
+    A_prev: (m, h_prev, w_prev, c_prev) unpadded input
+    W: (3, 3, c_prev, c_new)
+    ph, pw: padding on each side of height and width
+    h_out, w_out: output height and width
+    workspace: optional Workspace for the intermediate buffers
+
+    Returns:
+    (m, h_out, w_out, c_new) convolution without bias
+    """
+    m, h_prev, w_prev, c_prev = A_prev.shape
+    c_new = W.shape[3]
+    dtype = A_prev.dtype
+
+    # Each 4x4 input tile yields a 2x2 output tile, so pad the bottom
+    # and right up to a whole number of tiles
+    th = -(-h_out // 2)
+    tw = -(-w_out // 2)
+    A_prev_pad = pad_input(
+        A_prev,
+        (ph, 2 * th + 2 - h_prev - ph),
+        (pw, 2 * tw + 2 - w_prev - pw),
+        workspace
+    )
+    tiles = im2col(A_prev_pad, 4, 4, 2, 2)
+
+    # B^T d B, written out since B only holds 0 and +-1
+    D = get_buffer(workspace, 'wino_D', (4, m, th, tw, c_prev, 4), dtype)
+    t = [tiles[..., k, :] for k in range(4)]
+    np.subtract(t[0], t[2], out=D[0])
+    np.add(t[1], t[2], out=D[1])
+    np.subtract(t[2], t[1], out=D[2])
+    np.subtract(t[1], t[3], out=D[3])
+
+    V = get_buffer(workspace, 'wino_V', (4, 4, m, th, tw, c_prev), dtype)
+    for i in range(4):
+        np.subtract(D[i, ..., 0], D[i, ..., 2], out=V[i, 0])
+        np.add(D[i, ..., 1], D[i, ..., 2], out=V[i, 1])
+        np.subtract(D[i, ..., 2], D[i, ..., 1], out=V[i, 2])
+        np.subtract(D[i, ..., 1], D[i, ..., 3], out=V[i, 3])
+
+    # One (tiles x c_prev) x (c_prev x c_new) GEMM per transform
+    # coordinate: 16 multiplies per 2x2 outputs instead of 36
+    M = get_buffer(workspace, 'wino_M', (16, m * th * tw, c_new), dtype)
+    np.matmul(V.reshape(16, m * th * tw, c_prev), winograd_weights(W, dtype),
+              out=M)
+    M = M.reshape(4, 4, m, th, tw, c_new)
+
+    # A^T M A back to 2x2 output tiles
+    R = get_buffer(workspace, 'wino_R', (2, 4, m, th, tw, c_new), dtype)
+    np.add(M[0], M[1], out=R[0])
+    R[0] += M[2]
+    np.subtract(M[1], M[2], out=R[1])
+    R[1] -= M[3]
+
+    Y = get_buffer(workspace, 'wino_Y', (m, th, 2, tw, 2, c_new), dtype)
+    for a in range(2):
+        np.add(R[a, 0], R[a, 1], out=Y[:, :, a, :, 0])
+        Y[:, :, a, :, 0] += R[a, 2]
+        np.subtract(R[a, 1], R[a, 2], out=Y[:, :, a, :, 1])
+        Y[:, :, a, :, 1] -= R[a, 3]
+
+    return Y.reshape(m, 2 * th, 2 * tw, c_new)[:, :h_out, :w_out, :]
+
+
+def conv_forward(A_prev, W, b, activation, padding="same", stride=(1, 1),
+                 method="auto", cache=None, workspace=None, workers=1,
+                 dtype=None):
     """
     Performs forward propagation over a convolutional layer
 
@@ -14,6 +156,21 @@ def conv_forward(A_prev, W, b, activation, padding="same", stride=(1, 1)):
     activation: activation function
     padding: "same" or "valid"
     stride: (sh, sw)
+    method: "gemm" lowers the whole batch to a single matrix multiply,
+        "winograd" uses F(2x2, 3x3) minimal filtering (3x3 kernels,
+        stride (1, 1) only), "loop" uses the reference per-element loops,
+        "auto" picks "winograd" where it applies, c_prev is at least
+        WINOGRAD_MIN_CHANNELS and no cache is requested, "gemm" otherwise
+    cache: optional dict; with method "gemm" the unfolded input patches
+        are stored under 'cols' so conv_backward can reuse them, along
+        with the A_prev they come from ('A_prev') and the kernel size,
+        stride, padding and dtype they were unfolded with ('geometry')
+    workspace: optional Workspace (one per layer) holding the padded
+        input, unfolded patches and pre-activation output across calls
+    workers: number of threads the batch is split across (1 runs
+        the whole batch on the calling thread)
+    dtype: dtype to compute in (see dtypes.compute_dtype); by default
+        the floating dtype of A_prev, so float32 batches stay float32
 
     Returns:
     Output of the convolutional layer
@@ -23,6 +180,46 @@ def conv_forward(A_prev, W, b, activation, padding="same", stride=(1, 1)):
     kh, kw, _, c_new = W.shape
     sh, sw = stride
 
+    winograd_ok = kh == 3 and kw == 3 and sh == 1 and sw == 1
+    if method == "auto":
+        if (winograd_ok and c_prev >= WINOGRAD_MIN_CHANNELS and
+                cache is None):
+            method = "winograd"
+        else:
+            method = "gemm"
+    if method not in ("gemm", "winograd", "loop"):
+        raise ValueError(
+            "method must be 'auto', 'gemm', 'winograd' or 'loop'"
+        )
+    if method == "winograd" and not winograd_ok:
+        raise ValueError("winograd requires a 3x3 kernel and stride (1, 1)")
+
+    dtype = compute_dtype(A_prev, dtype)
+    if cache is not None:
+        # conv_backward only reuses the patches for this very input
+        cache.pop('cols', None)
+        cache['A_prev'] = A_prev
+        cache['geometry'] = (kh, kw, sh, sw, padding, dtype)
+    A_prev = A_prev.astype(dtype, copy=False)
+
+    if workers > 1 and m > 1:
+        n = len(batch_slices(m, workers))
+        caches = shard_caches(cache, n)
+        spaces = shard_workspaces(workspace, n)
+
+        def shard(k, start, end):
+            """Convolves one shard of the batch"""
+            return conv_forward(
+                A_prev[start:end], W, b, activation, padding, stride,
+                method, caches[k], spaces[k], dtype=dtype
+            )
+
+        outs = map_shards(shard, m, workers)
+        out = get_buffer(workspace, 'out', (m,) + outs[0].shape[1:],
+                         outs[0].dtype)
+
+        return np.concatenate(outs, axis=0, out=out)
+
     # ----- Padding -----
     if padding == "same":
         ph = int(np.ceil(((h_prev - 1) * sh + kh - h_prev) / 2))
@@ -31,18 +228,44 @@ def conv_forward(A_prev, W, b, activation, padding="same", stride=(1, 1)):
         ph = 0
         pw = 0
 
-    A_prev_pad = np.pad(
-        A_prev,
-        ((0, 0), (ph, ph), (pw, pw), (0, 0)),
-        mode="constant"
-    )
-
     # ----- Output dimensions -----
     h_out = int((h_prev + 2 * ph - kh) / sh) + 1
     w_out = int((w_prev + 2 * pw - kw) / sw) + 1
 
+    if method == "winograd":
+        Z = winograd_conv(A_prev, W, ph, pw, h_out, w_out, workspace)
+        np.add(Z, b, out=Z)
+
+        return activation(Z)
+
+    A_prev_pad = pad_input(A_prev, (ph, ph), (pw, pw), workspace)
+
+    if method == "gemm":
+        # (m * h_out * w_out, c_prev * kh * kw) x (c_prev * kh * kw, c_new)
+        cols = get_buffer(
+            workspace, 'cols', (m * h_out * w_out, c_prev * kh * kw), dtype
+        )
+        np.copyto(
+            cols.reshape(m, h_out, w_out, c_prev, kh, kw),
+            im2col(A_prev_pad, kh, kw, sh, sw)
+        )
+        W_col = get_buffer(workspace, 'W_col', (c_prev * kh * kw, c_new),
+                           dtype)
+        np.copyto(W_col.reshape(c_prev, kh, kw, c_new),
+                  W.transpose(2, 0, 1, 3))
+
+        Z = get_buffer(workspace, 'Z', (m * h_out * w_out, c_new), dtype)
+        np.matmul(cols, W_col, out=Z)
+        Z = Z.reshape(m, h_out, w_out, c_new)
+        np.add(Z, b, out=Z)
+
+        if cache is not None:
+            cache['cols'] = cols
+
+        return activation(Z)
+
     # Initialize output
-    Z = np.zeros((m, h_out, w_out, c_new))
+    Z = np.zeros((m, h_out, w_out, c_new), dtype=dtype)
 
     # ----- Convolution -----
     for i in range(m):  # loop over examples
@@ -63,7 +286,7 @@ def conv_forward(A_prev, W, b, activation, padding="same", stride=(1, 1)):
 
                     Z[i, h, w, c] = np.sum(
                         slice_prev * W[:, :, :, c]
-                    ) + b[:, :, :, c]
+                    ) + b[0, 0, 0, c]
 
     # Apply activation
     return activation(Z)
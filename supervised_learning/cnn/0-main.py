@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import numpy as np
+conv_forward = __import__('0-conv_forward').conv_forward
+WINOGRAD_MIN_CHANNELS = __import__('0-conv_forward').WINOGRAD_MIN_CHANNELS
+
+# Largest error of winograd relative to the largest output magnitude: a
+# few thousand units in the last place in float64, a few in float32
+TOLERANCE = {np.float64: 1e-12, np.float32: 1e-6}
+
+
+def identity(Z):
+    """Linear activation"""
+    return Z
+
+
+np.random.seed(0)
+for c_prev in (3, WINOGRAD_MIN_CHANNELS // 2, WINOGRAD_MIN_CHANNELS + 32):
+    # Odd sizes leave partial 2x2 output tiles on both axes
+    A_prev = np.random.randn(2, 13, 9, c_prev)
+    W = np.random.randn(3, 3, c_prev, 5)
+    b = np.random.randn(1, 1, 1, 5)
+    for dtype in (np.float64, np.float32):
+        for padding in ("same", "valid"):
+            winograd = conv_forward(A_prev, W, b, identity, padding,
+                                    method="winograd", dtype=dtype)
+            scale = np.abs(winograd).max()
+            errors = [
+                np.abs(winograd - conv_forward(
+                    A_prev, W, b, identity, padding, method=method,
+                    dtype=dtype
+                )).max() / scale
+                for method in ("loop", "gemm")
+            ]
+            print("c_prev={:<3} {:<7} {:<5} {} error vs loop {:.1e}, "
+                  "vs gemm {:.1e}".format(c_prev, np.dtype(dtype).name,
+                                          padding, winograd.shape,
+                                          *errors))
+            assert winograd.dtype == dtype
+            assert max(errors) <= TOLERANCE[dtype]
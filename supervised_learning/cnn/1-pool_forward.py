@@ -2,9 +2,85 @@
 """Pooling forward propagation"""
 
 import numpy as np
+compute_dtype = __import__('dtypes').compute_dtype
+get_buffer = __import__('workspace').get_buffer
+batch_slices = __import__('parallel').batch_slices
+map_shards = __import__('parallel').map_shards
+shard_caches = __import__('parallel').shard_caches
+shard_workspaces = __import__('parallel').shard_workspaces
+running_max = __import__('pool_running_max').running_max
 
 
-def pool_forward(A_prev, kernel_shape, stride=(1, 1), mode='max'):
+def pool_windows(A_prev, kernel_shape, stride):
+    """
+    Strided view of every pooling window
+
+    A_prev: (m, h_prev, w_prev, c_prev)
+    kernel_shape: (kh, kw)
+    stride: (sh, sw)
+
+    Returns:
+    View of shape (m, h_out, w_out, c_prev, kh, kw)
+    """
+    kh, kw = kernel_shape
+    sh, sw = stride
+
+    windows = np.lib.stride_tricks.sliding_window_view(
+        A_prev, (kh, kw), axis=(1, 2)
+    )
+
+    return windows[:, ::sh, ::sw]
+
+
+def index_dtype(size):
+    """
+    Smallest signed integer dtype able to index a window of `size`
+    """
+    for dtype in (np.int8, np.int16):
+        if size <= np.iinfo(dtype).max + 1:
+            return dtype
+    return np.int32
+
+
+def pool_argmax(A_prev, kernel_shape, stride, workspace=None):
+    """
+    Finds the maximum of every pooling window and where it sits
+
+    A_prev: (m, h_prev, w_prev, c_prev)
+    kernel_shape: (kh, kw)
+    stride: (sh, sw)
+    workspace: optional Workspace for the output and scratch buffers
+
+    Returns:
+    A, argmax
+    A: (m, h_out, w_out, c_prev) window maxima
+    argmax: (m, h_out, w_out, c_prev) flat row-major window offsets, so
+        the first of several tied maxima wins; stored as int8/int16
+        whenever the window is small enough
+    """
+    kh, kw = kernel_shape
+    windows = pool_windows(A_prev, kernel_shape, stride)
+    out_shape = windows.shape[:4]
+
+    flat = get_buffer(workspace, 'flat', out_shape + (kh * kw,),
+                      A_prev.dtype)
+    np.copyto(flat.reshape(windows.shape), windows)
+
+    A = get_buffer(workspace, 'A', out_shape, A_prev.dtype)
+    np.max(flat, axis=-1, out=A)
+
+    offsets = get_buffer(workspace, 'offsets', out_shape, np.intp)
+    np.argmax(flat, axis=-1, out=offsets)
+    argmax = get_buffer(workspace, 'argmax', out_shape,
+                        index_dtype(kh * kw))
+    np.copyto(argmax, offsets, casting='unsafe')
+
+    return A, argmax
+
+
+def pool_forward(A_prev, kernel_shape, stride=(1, 1), mode='max',
+                 method="vectorized", cache=None, workspace=None, workers=1,
+                 dtype=None):
     """
     Performs forward propagation over a pooling layer
 
@@ -12,6 +88,22 @@ def pool_forward(A_prev, kernel_shape, stride=(1, 1), mode='max'):
     kernel_shape: (kh, kw)
     stride: (sh, sw)
     mode: 'max' or 'avg'
+    method: "vectorized" reduces all windows at once,
+        "running" (max mode) takes van Herk/Gil-Werman running maxima
+        over rows, then columns, at a cost independent of the window
+        size, which pays off for large overlapping windows (with a
+        cache it falls back to "vectorized", pool_backward needs the
+        argmax),
+        "loop" uses the reference per-element loops
+    cache: optional dict; in 'max' mode the argmax offsets of every
+        window are stored under 'argmax' for pool_backward, with the
+        (kh, kw, sh, sw) they were found with under 'geometry'
+    workspace: optional Workspace (one per layer) holding the output
+        and argmax buffers across calls
+    workers: number of threads the batch is split across (1 runs
+        the whole batch on the calling thread)
+    dtype: dtype to compute in (see dtypes.compute_dtype); by default
+        the floating dtype of A_prev, so float32 batches stay float32
 
     Returns:
     Output of the pooling layer
@@ -21,12 +113,61 @@ def pool_forward(A_prev, kernel_shape, stride=(1, 1), mode='max'):
     kh, kw = kernel_shape
     sh, sw = stride
 
+    if method not in ("vectorized", "running", "loop"):
+        raise ValueError("method must be 'vectorized', 'running' or 'loop'")
+    if method == "running" and mode != 'max':
+        raise ValueError("method 'running' only supports mode 'max'")
+
+    A_prev = A_prev.astype(compute_dtype(A_prev, dtype), copy=False)
+    if cache is not None:
+        # Never leave the offsets of an earlier call behind
+        cache.pop('argmax', None)
+
+    if workers > 1 and m > 1:
+        n = len(batch_slices(m, workers))
+        caches = shard_caches(cache, n)
+        spaces = shard_workspaces(workspace, n)
+
+        def shard(k, start, end):
+            """Pools one shard of the batch"""
+            return pool_forward(
+                A_prev[start:end], kernel_shape, stride, mode, method,
+                caches[k], spaces[k]
+            )
+
+        outs = map_shards(shard, m, workers)
+        out = get_buffer(workspace, 'out', (m,) + outs[0].shape[1:],
+                         outs[0].dtype)
+
+        return np.concatenate(outs, axis=0, out=out)
+
+    if method == "running" and cache is None:
+        rows = running_max(A_prev, kw, 2, sw, workspace, 'rows')
+        return running_max(rows, kh, 1, sh, workspace, 'cols')
+
+    # With a cache, pool_backward needs the argmax of every window
+    if method != "loop":
+        if mode == 'max' and cache is not None:
+            A, cache['argmax'] = pool_argmax(
+                A_prev, kernel_shape, stride, workspace
+            )
+            cache['geometry'] = (kh, kw, sh, sw)
+            return A
+
+        windows = pool_windows(A_prev, kernel_shape, stride)
+        A = get_buffer(workspace, 'A', windows.shape[:4], A_prev.dtype)
+        if mode == 'max':
+            return np.max(windows, axis=(4, 5), out=A)
+        elif mode == 'avg':
+            return np.mean(windows, axis=(4, 5), out=A)
+        raise ValueError("mode must be 'max' or 'avg'")
+
     # Output dimensions
     h_out = int((h_prev - kh) / sh) + 1
     w_out = int((w_prev - kw) / sw) + 1
 
     # Initialize output
-    A = np.zeros((m, h_out, w_out, c_prev))
+    A = np.zeros((m, h_out, w_out, c_prev), dtype=A_prev.dtype)
 
     # Perform pooling
     for i in range(m):  # loop over examples
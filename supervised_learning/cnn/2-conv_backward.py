@@ -2,9 +2,52 @@
 """Convolutional backward propagation"""
 
 import numpy as np
+im2col = __import__('0-conv_forward').im2col
+compute_dtype = __import__('dtypes').compute_dtype
+get_buffer = __import__('workspace').get_buffer
+pad_input = __import__('workspace').pad_input
+batch_slices = __import__('parallel').batch_slices
+map_shards = __import__('parallel').map_shards
+shard_caches = __import__('parallel').shard_caches
+shard_workspaces = __import__('parallel').shard_workspaces
 
 
-def conv_backward(dZ, A_prev, W, b, padding="same", stride=(1, 1)):
+def col2im(dcols, shape, kh, kw, sh, sw, out=None):
+    """
+    Folds unfolded window gradients back onto the padded input
+
+    dcols: (m, h_new, w_new, c_prev, kh, kw) gradient per window element
+    shape: shape of the padded input (m, h_pad, w_pad, c_prev)
+    kh, kw: kernel height and width
+    sh, sw: stride along height and width
+    out: optional array of shape `shape` to fold into (it is zeroed)
+
+    Returns:
+    Padded gradient of shape `shape`, overlapping windows summed
+    """
+    _, h_new, w_new = dcols.shape[:3]
+    if out is None:
+        dA_pad = np.zeros(shape, dtype=dcols.dtype)
+    else:
+        dA_pad = out
+        dA_pad.fill(0)
+
+    # One scatter-add per kernel offset instead of per output element
+    for p in range(kh):
+        for q in range(kw):
+            dA_pad[
+                :,
+                p:p + sh * h_new:sh,
+                q:q + sw * w_new:sw,
+                :
+            ] += dcols[:, :, :, :, p, q]
+
+    return dA_pad
+
+
+def conv_backward(dZ, A_prev, W, b, padding="same", stride=(1, 1),
+                  method="gemm", cache=None, workspace=None, workers=1,
+                  dtype=None):
     """
     Performs backward propagation over a convolutional layer
 
@@ -14,6 +57,19 @@ def conv_backward(dZ, A_prev, W, b, padding="same", stride=(1, 1)):
     b: (1, 1, 1, c_new)
     padding: "same" or "valid"
     stride: (sh, sw)
+    method: "gemm" computes dW and dA_prev with matrix multiplies,
+        "loop" uses the reference per-element loops
+    cache: optional dict filled by conv_forward; its unfolded patches
+        ('cols') are reused instead of unfolding A_prev again when they
+        were unfolded from this very A_prev object with the same kernel
+        size, stride, padding and dtype, and rebuilt otherwise (A_prev
+        must not be modified in place in between)
+    workspace: optional Workspace (one per layer, may be the one given
+        to conv_forward) holding the gradient buffers across calls
+    workers: number of threads the batch is split across; the per-shard
+        dW and db partial sums are added up at the end
+    dtype: dtype to compute in (see dtypes.compute_dtype); by default
+        the floating dtype of A_prev, so float32 batches stay float32
 
     Returns:
     dA_prev, dW, db
@@ -24,6 +80,50 @@ def conv_backward(dZ, A_prev, W, b, padding="same", stride=(1, 1)):
     sh, sw = stride
     _, h_new, w_new, _ = dZ.shape
 
+    if method not in ("gemm", "loop"):
+        raise ValueError("method must be 'gemm' or 'loop'")
+
+    dtype = compute_dtype(A_prev, dtype)
+    if cache is not None and (
+            cache.get('A_prev') is not A_prev or
+            cache.get('geometry') != (kh, kw, sh, sw, padding, dtype)):
+        # Patches of another input (a different batch, even of the same
+        # shape) or another layer: unfold A_prev again
+        cache = None
+    A_prev = A_prev.astype(dtype, copy=False)
+    dZ = dZ.astype(dtype, copy=False)
+
+    if workers > 1 and m > 1:
+        n = len(batch_slices(m, workers))
+        caches = shard_caches(cache, n)
+        spaces = shard_workspaces(workspace, n)
+
+        def shard(k, start, end):
+            """Backpropagates one shard of the batch"""
+            A_shard = A_prev[start:end]
+            if caches[k] is not None:
+                # A_prev matched above, so the slice conv_forward gave
+                # this shard holds the same examples
+                A_shard = caches[k].get('A_prev', A_shard)
+            return conv_backward(
+                dZ[start:end], A_shard, W, b, padding, stride,
+                method, caches[k], spaces[k], dtype=dtype
+            )
+
+        outs = map_shards(shard, m, workers)
+        dA_prev = get_buffer(workspace, 'dA_prev', A_prev.shape, dtype)
+        np.concatenate([out[0] for out in outs], axis=0, out=dA_prev)
+
+        dW = get_buffer(workspace, 'dW', W.shape, dtype)
+        db = get_buffer(workspace, 'db', b.shape, dtype)
+        np.copyto(dW, outs[0][1])
+        np.copyto(db, outs[0][2])
+        for out in outs[1:]:
+            dW += out[1]
+            db += out[2]
+
+        return dA_prev, dW, db
+
     # ----- Padding calculation -----
     if padding == "same":
         ph = int(np.ceil(((h_prev - 1) * sh + kh - h_prev) / 2))
@@ -32,17 +132,55 @@ def conv_backward(dZ, A_prev, W, b, padding="same", stride=(1, 1)):
         ph = 0
         pw = 0
 
-    # Pad A_prev and dA_prev
-    A_prev_pad = np.pad(
-        A_prev,
-        ((0, 0), (ph, ph), (pw, pw), (0, 0)),
-        mode='constant'
-    )
+    pad_shape = (m, h_prev + 2 * ph, w_prev + 2 * pw, c_prev)
+
+    if method == "gemm":
+        n_win = m * h_new * w_new
+
+        db = get_buffer(workspace, 'db', b.shape, dtype)
+        np.sum(dZ, axis=(0, 1, 2), keepdims=True, out=db)
+
+        cols = None if cache is None else cache.get('cols')
+        if cols is None:
+            A_prev_pad = pad_input(A_prev, (ph, ph), (pw, pw), workspace)
+            cols = get_buffer(
+                workspace, 'cols', (n_win, c_prev * kh * kw), dtype
+            )
+            np.copyto(
+                cols.reshape(m, h_new, w_new, c_prev, kh, kw),
+                im2col(A_prev_pad, kh, kw, sh, sw)
+            )
+        dZ_col = dZ.reshape(n_win, c_new)
+        W_col = get_buffer(workspace, 'W_col', (c_prev * kh * kw, c_new),
+                           dtype)
+        np.copyto(W_col.reshape(c_prev, kh, kw, c_new),
+                  W.transpose(2, 0, 1, 3))
+
+        # dW: one GEMM over all unfolded patches
+        dW_col = get_buffer(workspace, 'dW_col', W_col.shape, dtype)
+        np.matmul(cols.T, dZ_col, out=dW_col)
+        dW = get_buffer(workspace, 'dW', W.shape, dtype)
+        np.copyto(dW, dW_col.reshape(c_prev, kh, kw, c_new).transpose(
+            1, 2, 0, 3
+        ))
+
+        # dA_prev: transposed convolution, folded back with col2im
+        dcols = get_buffer(workspace, 'dcols', cols.shape, dtype)
+        np.matmul(dZ_col, W_col.T, out=dcols)
+        dA_prev_pad = col2im(
+            dcols.reshape(m, h_new, w_new, c_prev, kh, kw),
+            pad_shape, kh, kw, sh, sw,
+            out=get_buffer(workspace, 'dA_prev_pad', pad_shape, dtype)
+        )
+
+        return dA_prev_pad[:, ph:ph + h_prev, pw:pw + w_prev, :], dW, db
+
+    A_prev_pad = pad_input(A_prev, (ph, ph), (pw, pw))
     dA_prev_pad = np.zeros_like(A_prev_pad)
 
     # Initialize gradients
-    dW = np.zeros_like(W)
     db = np.sum(dZ, axis=(0, 1, 2), keepdims=True)
+    dW = np.zeros(W.shape, dtype=dtype)
 
     # ----- Backprop loop -----
     for i in range(m):
@@ -75,9 +213,6 @@ def conv_backward(dZ, A_prev, W, b, padding="same", stride=(1, 1)):
                     dW[:, :, :, c] += a_slice * dZ[i, h, w, c]
 
     # Remove padding from dA_prev
-    if padding == "same":
-        dA_prev = dA_prev_pad[:, ph:-ph, pw:-pw, :]
-    else:
-        dA_prev = dA_prev_pad
+    dA_prev = dA_prev_pad[:, ph:ph + h_prev, pw:pw + w_prev, :]
 
     return dA_prev, dW, db
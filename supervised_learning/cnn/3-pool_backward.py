@@ -2,9 +2,18 @@
 """Pooling backward propagation"""
 
 import numpy as np
-
-
-def pool_backward(dA, A_prev, kernel_shape, stride=(1, 1), mode='max'):
+pool_argmax = __import__('1-pool_forward').pool_argmax
+compute_dtype = __import__('dtypes').compute_dtype
+get_buffer = __import__('workspace').get_buffer
+batch_slices = __import__('parallel').batch_slices
+map_shards = __import__('parallel').map_shards
+shard_caches = __import__('parallel').shard_caches
+shard_workspaces = __import__('parallel').shard_workspaces
+
+
+def pool_backward(dA, A_prev, kernel_shape, stride=(1, 1), mode='max',
+                  method="vectorized", cache=None, workspace=None,
+                  workers=1, dtype=None):
     """
     Performs backward propagation over a pooling layer
 
@@ -13,6 +22,18 @@ def pool_backward(dA, A_prev, kernel_shape, stride=(1, 1), mode='max'):
     kernel_shape: (kh, kw)
     stride: (sh, sw)
     mode: 'max' or 'avg'
+    method: "vectorized" scatters the gradient once per kernel offset,
+        "loop" uses the reference per-element loops
+    cache: optional dict filled by pool_forward; its 'argmax' offsets
+        are reused instead of searching every window again when their
+        shape and window geometry match this call, and recomputed
+        otherwise
+    workspace: optional Workspace (one per layer, may be the one given
+        to pool_forward) holding the gradient buffers across calls
+    workers: number of threads the batch is split across (1 runs
+        the whole batch on the calling thread)
+    dtype: dtype to compute in (see dtypes.compute_dtype); by default
+        the floating dtype of A_prev, so float32 batches stay float32
 
     Returns:
     dA_prev
@@ -23,6 +44,67 @@ def pool_backward(dA, A_prev, kernel_shape, stride=(1, 1), mode='max'):
     kh, kw = kernel_shape
     sh, sw = stride
 
+    if method not in ("vectorized", "loop"):
+        raise ValueError("method must be 'vectorized' or 'loop'")
+
+    dtype = compute_dtype(A_prev, dtype)
+    A_prev = A_prev.astype(dtype, copy=False)
+    dA = dA.astype(dtype, copy=False)
+
+    if workers > 1 and m > 1:
+        n = len(batch_slices(m, workers))
+        caches = shard_caches(cache, n)
+        spaces = shard_workspaces(workspace, n)
+
+        def shard(k, start, end):
+            """Backpropagates one shard of the batch"""
+            return pool_backward(
+                dA[start:end], A_prev[start:end], kernel_shape, stride,
+                mode, method, caches[k], spaces[k], dtype=dtype
+            )
+
+        outs = map_shards(shard, m, workers)
+        out = get_buffer(workspace, 'out', A_prev.shape, outs[0].dtype)
+
+        return np.concatenate(outs, axis=0, out=out)
+
+    if method == "vectorized":
+        grad = get_buffer(workspace, 'grad', dA.shape, dtype)
+
+        if mode == 'max':
+            argmax = None if cache is None else cache.get('argmax')
+            # Offsets of another layer or batch shape would scatter the
+            # gradient to the wrong cells
+            if (argmax is None or argmax.shape != dA.shape[:3] + (c,) or
+                    cache.get('geometry') != (kh, kw, sh, sw)):
+                _, argmax = pool_argmax(
+                    A_prev, kernel_shape, stride, workspace
+                )
+            mask = get_buffer(workspace, 'mask', dA.shape, bool)
+        elif mode == 'avg':
+            np.divide(dA, kh * kw, out=grad)
+        else:
+            raise ValueError("mode must be 'max' or 'avg'")
+
+        dA_prev = get_buffer(workspace, 'dA_prev', A_prev.shape, dtype)
+        dA_prev.fill(0)
+
+        # Windows at one kernel offset never overlap each other
+        for p in range(kh):
+            for q in range(kw):
+                region = dA_prev[
+                    :,
+                    p:p + sh * h_new:sh,
+                    q:q + sw * w_new:sw,
+                    :
+                ]
+                if mode == 'max':
+                    np.equal(argmax, p * kw + q, out=mask)
+                    np.multiply(mask, dA, out=grad)
+                region += grad
+
+        return dA_prev
+
     dA_prev = np.zeros_like(A_prev)
 
     for i in range(m):
@@ -44,7 +126,10 @@ def pool_backward(dA, A_prev, kernel_shape, stride=(1, 1), mode='max'):
                             ch
                         ]
 
-                        mask = (a_slice == np.max(a_slice))
+                        # Only the first maximum receives the gradient
+                        mask = np.zeros(a_slice.size)
+                        mask[np.argmax(a_slice)] = 1
+                        mask = mask.reshape(a_slice.shape)
 
                         dA_prev[
                             i,
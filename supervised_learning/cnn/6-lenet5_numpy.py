@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""LeNet-5 architecture in pure NumPy"""
+
+import time
+import numpy as np
+conv_forward = __import__('0-conv_forward').conv_forward
+pool_forward = __import__('1-pool_forward').pool_forward
+conv_backward = __import__('2-conv_backward').conv_backward
+pool_backward = __import__('3-pool_backward').pool_backward
+Workspace = __import__('workspace').Workspace
+get_buffer = __import__('workspace').get_buffer
+
+LAYERS = ('conv1', 'pool1', 'conv2', 'pool2', 'fc3', 'fc4', 'fc5')
+
+
+def relu(Z):
+    """ReLU applied in place, so workspace buffers are reused"""
+    return np.maximum(Z, 0, out=Z)
+
+
+class LeNet5:
+    """
+    Modified LeNet-5 (same layers as 5-lenet5.lenet5) trained with Adam
+    on top of the NumPy conv and pool primitives, without TensorFlow
+    """
+
+    def __init__(self, seed=0, dtype=np.float32, workers=1):
+        """
+        Initializes the network
+
+        seed: seed of the He normal weight initialization
+        dtype: dtype of the weights and activations
+        workers: number of threads each conv/pool layer shards its
+            batch across
+        """
+        rng = np.random.default_rng(seed)
+        shapes = {
+            'W1': (5, 5, 1, 6),
+            'W2': (5, 5, 6, 16),
+            'W3': (400, 120),
+            'W4': (120, 84),
+            'W5': (84, 10)
+        }
+
+        self.dtype = np.dtype(dtype)
+        self.workers = workers
+        self.weights = {}
+        for name, shape in shapes.items():
+            fan_in = int(np.prod(shape[:-1]))
+            self.weights[name] = (
+                rng.standard_normal(shape) * np.sqrt(2 / fan_in)
+            ).astype(self.dtype)
+            bias_shape = (1,) * (len(shape) - 1) + (shape[-1],)
+            self.weights['b' + name[1:]] = np.zeros(bias_shape,
+                                                    dtype=self.dtype)
+
+        self.adam = {
+            't': 0,
+            'v': {k: np.zeros_like(w) for k, w in self.weights.items()},
+            's': {k: np.zeros_like(w) for k, w in self.weights.items()}
+        }
+        self.workspaces = {layer: Workspace() for layer in LAYERS}
+        self.cache = {}
+        self.timings = {
+            layer: {'forward': 0.0, 'backward': 0.0} for layer in LAYERS
+        }
+
+    def _timed(self, layer, direction, start):
+        """Adds the time elapsed since `start` to a layer's timings"""
+        self.timings[layer][direction] += time.perf_counter() - start
+
+    def _dense(self, layer, A_prev, W, b, activation):
+        """Forward pass of a dense layer into its workspace buffer"""
+        Z = get_buffer(self.workspaces[layer], 'Z',
+                       (A_prev.shape[0], W.shape[1]), self.dtype)
+        np.matmul(A_prev, W, out=Z)
+        Z += b
+
+        return activation(Z)
+
+    def forward_prop(self, X):
+        """
+        Calculates the forward propagation of the network
+
+        X: (m, 28, 28, 1) input images
+
+        Returns:
+        (m, 10) softmax output; intermediate activations are kept in
+        self.cache for backward_prop
+        """
+        w = self.weights
+        ws = self.workspaces
+        cache = self.cache
+        X = X.astype(self.dtype, copy=False)
+        cache['X'] = X
+
+        start = time.perf_counter()
+        cache['conv1'] = {}
+        cache['A1'] = conv_forward(
+            X, w['W1'], w['b1'], relu, padding="same",
+            cache=cache['conv1'], workspace=ws['conv1'],
+            workers=self.workers, dtype=self.dtype
+        )
+        self._timed('conv1', 'forward', start)
+
+        start = time.perf_counter()
+        cache['pool1'] = {}
+        cache['P1'] = pool_forward(
+            cache['A1'], (2, 2), (2, 2), cache=cache['pool1'],
+            workspace=ws['pool1'], workers=self.workers, dtype=self.dtype
+        )
+        self._timed('pool1', 'forward', start)
+
+        start = time.perf_counter()
+        cache['conv2'] = {}
+        cache['A2'] = conv_forward(
+            cache['P1'], w['W2'], w['b2'], relu, padding="valid",
+            cache=cache['conv2'], workspace=ws['conv2'],
+            workers=self.workers, dtype=self.dtype
+        )
+        self._timed('conv2', 'forward', start)
+
+        start = time.perf_counter()
+        cache['pool2'] = {}
+        cache['P2'] = pool_forward(
+            cache['A2'], (2, 2), (2, 2), cache=cache['pool2'],
+            workspace=ws['pool2'], workers=self.workers, dtype=self.dtype
+        )
+        self._timed('pool2', 'forward', start)
+
+        start = time.perf_counter()
+        flat = cache['P2'].reshape(X.shape[0], -1)
+        cache['F'] = flat
+        cache['A3'] = self._dense('fc3', flat, w['W3'], w['b3'], relu)
+        self._timed('fc3', 'forward', start)
+
+        start = time.perf_counter()
+        cache['A4'] = self._dense('fc4', cache['A3'], w['W4'], w['b4'],
+                                  relu)
+        self._timed('fc4', 'forward', start)
+
+        start = time.perf_counter()
+        Z5 = self._dense('fc5', cache['A4'], w['W5'], w['b5'],
+                         lambda Z: Z)
+        Z5 -= np.max(Z5, axis=1, keepdims=True)
+        np.exp(Z5, out=Z5)
+        Z5 /= np.sum(Z5, axis=1, keepdims=True)
+        cache['A5'] = Z5
+        self._timed('fc5', 'forward', start)
+
+        return Z5
+
+    @staticmethod
+    def cost(Y, A):
+        """
+        Categorical cross-entropy
+
+        Y: (m, 10) one-hot labels
+        A: (m, 10) softmax output
+
+        Returns:
+        mean cost over the batch
+        """
+        return -np.sum(Y * np.log(np.clip(A, 1e-10, 1))) / Y.shape[0]
+
+    def backward_prop(self, Y):
+        """
+        Calculates the gradients of the last forward_prop
+
+        Y: (m, 10) one-hot labels
+
+        Returns:
+        dict of gradients keyed like self.weights
+        """
+        w = self.weights
+        ws = self.workspaces
+        cache = self.cache
+        m = Y.shape[0]
+        grads = {}
+
+        start = time.perf_counter()
+        dZ = (cache['A5'] - Y).astype(self.dtype, copy=False) / m
+        grads['W5'] = cache['A4'].T @ dZ
+        grads['b5'] = np.sum(dZ, axis=0, keepdims=True)
+        dA = dZ @ w['W5'].T
+        self._timed('fc5', 'backward', start)
+
+        for layer, i, A_prev in (('fc4', 4, cache['A3']),
+                                 ('fc3', 3, cache['F'])):
+            start = time.perf_counter()
+            dA *= cache['A' + str(i)] > 0
+            grads['W' + str(i)] = A_prev.T @ dA
+            grads['b' + str(i)] = np.sum(dA, axis=0, keepdims=True)
+            dA = dA @ w['W' + str(i)].T
+            self._timed(layer, 'backward', start)
+
+        start = time.perf_counter()
+        dA = pool_backward(
+            dA.reshape(cache['P2'].shape), cache['A2'], (2, 2), (2, 2),
+            cache=cache['pool2'], workspace=ws['pool2'],
+            workers=self.workers, dtype=self.dtype
+        )
+        self._timed('pool2', 'backward', start)
+
+        start = time.perf_counter()
+        dA *= cache['A2'] > 0
+        dA, grads['W2'], grads['b2'] = conv_backward(
+            dA, cache['P1'], w['W2'], w['b2'], padding="valid",
+            cache=cache['conv2'], workspace=ws['conv2'],
+            workers=self.workers, dtype=self.dtype
+        )
+        self._timed('conv2', 'backward', start)
+
+        start = time.perf_counter()
+        dA = pool_backward(
+            dA, cache['A1'], (2, 2), (2, 2), cache=cache['pool1'],
+            workspace=ws['pool1'], workers=self.workers, dtype=self.dtype
+        )
+        self._timed('pool1', 'backward', start)
+
+        start = time.perf_counter()
+        dA *= cache['A1'] > 0
+        _, grads['W1'], grads['b1'] = conv_backward(
+            dA, cache['X'], w['W1'], w['b1'], padding="same",
+            cache=cache['conv1'], workspace=ws['conv1'],
+            workers=self.workers, dtype=self.dtype
+        )
+        self._timed('conv1', 'backward', start)
+
+        return grads
+
+    def update(self, grads, alpha=0.001, beta1=0.9, beta2=0.999,
+               epsilon=1e-7):
+        """
+        Updates the weights in place with Adam
+
+        grads: gradients returned by backward_prop
+        alpha: learning rate
+        beta1, beta2: decay of the first and second moments
+        epsilon: small number avoiding division by zero
+        """
+        adam = self.adam
+        adam['t'] += 1
+        t = adam['t']
+
+        for name, W in self.weights.items():
+            v = adam['v'][name]
+            s = adam['s'][name]
+            v *= beta1
+            v += (1 - beta1) * grads[name]
+            s *= beta2
+            s += (1 - beta2) * np.square(grads[name])
+            v_corr = v / (1 - beta1 ** t)
+            s_corr = s / (1 - beta2 ** t)
+            W -= alpha * v_corr / (np.sqrt(s_corr) + epsilon)
+
+    def train(self, X, Y, epochs=5, batch_size=32, alpha=0.001,
+              shuffle=True, verbose=True, seed=0):
+        """
+        Trains the network with mini-batch Adam
+
+        X: (m, 28, 28, 1) input images
+        Y: (m, 10) one-hot labels
+        epochs: number of passes through the data
+        batch_size: number of examples per mini-batch
+        alpha: learning rate
+        shuffle: whether to shuffle the examples every epoch
+        verbose: whether to print the cost after every epoch
+        seed: seed of the shuffling
+
+        Returns:
+        list of the mean training cost of every epoch
+        """
+        rng = np.random.default_rng(seed)
+        m = X.shape[0]
+        history = []
+
+        for epoch in range(epochs):
+            order = rng.permutation(m) if shuffle else np.arange(m)
+            total = 0.0
+
+            for start in range(0, m, batch_size):
+                idx = order[start:start + batch_size]
+                X_batch = X[idx]
+                Y_batch = Y[idx]
+
+                A = self.forward_prop(X_batch)
+                total += self.cost(Y_batch, A) * len(idx)
+                self.update(self.backward_prop(Y_batch), alpha)
+
+            history.append(total / m)
+            if verbose:
+                print("Epoch {}: cost {:.4f}".format(epoch + 1,
+                                                     history[-1]))
+
+        return history
+
+    def predict(self, X, batch_size=256):
+        """
+        Predicts class probabilities
+
+        X: (m, 28, 28, 1) input images
+        batch_size: number of examples per forward pass
+
+        Returns:
+        (m, 10) softmax output
+        """
+        return np.concatenate([
+            self.forward_prop(X[start:start + batch_size]).copy()
+            for start in range(0, X.shape[0], batch_size)
+        ])
+
+    def evaluate(self, X, Y, batch_size=256):
+        """
+        Evaluates the network
+
+        X: (m, 28, 28, 1) input images
+        Y: (m, 10) one-hot labels
+        batch_size: number of examples per forward pass
+
+        Returns:
+        cost, accuracy
+        """
+        A = self.predict(X, batch_size)
+        accuracy = np.mean(np.argmax(A, axis=1) == np.argmax(Y, axis=1))
+
+        return self.cost(Y, A), accuracy
+
+    def timing_report(self):
+        """
+        Per-layer forward and backward time accumulated so far
+
+        Returns:
+        formatted table as a string
+        """
+        lines = ["{:<8} {:>12} {:>12}".format(
+            'layer', 'forward (s)', 'backward (s)'
+        )]
+        for layer in LAYERS:
+            lines.append("{:<8} {:>12.4f} {:>12.4f}".format(
+                layer, self.timings[layer]['forward'],
+                self.timings[layer]['backward']
+            ))
+
+        return "\n".join(lines)
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the NumPy cnn layers
+
+Run `./benchmark.py --json results.json` to sweep the conv and pool
+layers and store the results, and `--compare results.json` on a later
+commit to print the speedup against them. Keras parity is checked
+when TensorFlow is installed: rows whose error exceeds the tolerance
+(--tol, or TOLERANCE for their dtype) are flagged and the run exits
+with status 1.
+"""
+
+import argparse
+import itertools
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+conv_forward = __import__('0-conv_forward').conv_forward
+pool_forward = __import__('1-pool_forward').pool_forward
+conv_backward = __import__('2-conv_backward').conv_backward
+pool_backward = __import__('3-pool_backward').pool_backward
+
+SWEEPS = {
+    'quick': {
+        'm': [8],
+        'hw': [28],
+        'c': [8],
+        'kernel': [3, 5],
+        'stride': [1, 2],
+        'padding': ['valid', 'same']
+    },
+    'full': {
+        'm': [1, 32, 128],
+        'hw': [14, 28, 56],
+        'c': [3, 16, 64],
+        'kernel': [1, 3, 5],
+        'stride': [1, 2],
+        'padding': ['valid', 'same']
+    }
+}
+
+# Largest absolute error against Keras accepted for each input dtype
+TOLERANCE = {'float64': 1e-4, 'float32': 1e-2}
+
+
+def time_op(fn, repeat=5):
+    """
+    Best wall time of fn() over `repeat` runs, after one warm-up run
+
+    fn: callable without arguments
+    repeat: number of timed runs
+
+    Returns:
+    time in seconds
+    """
+    fn()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def bench_dtype(m=64, hw=28, c=16, c_new=32, kernel=3, repeat=5, seed=0):
+    """
+    Compares conv_forward and pool_forward in float64 and float32
+
+    m, hw, c: batch size, spatial size and channels of the input
+    c_new: number of convolution filters
+    kernel: convolution kernel size
+    repeat: number of timed runs per measurement
+    seed: seed of the random inputs
+
+    Returns:
+    list of dicts with the layer, dtype, ms/op and effective GB/s
+    (input plus output bytes over the best time)
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+
+    for dtype in (np.float64, np.float32):
+        A = rng.standard_normal((m, hw, hw, c)).astype(dtype)
+        W = rng.standard_normal((kernel, kernel, c, c_new)).astype(dtype)
+        b = np.zeros((1, 1, 1, c_new), dtype=dtype)
+
+        layers = {
+            'conv_forward': lambda: conv_forward(
+                A, W, b, np.tanh, padding="same"
+            ),
+            'pool_forward': lambda: pool_forward(
+                A, (2, 2), stride=(2, 2)
+            )
+        }
+
+        for name, fn in layers.items():
+            seconds = time_op(fn, repeat)
+            moved = A.nbytes + fn().nbytes
+            results.append({
+                'layer': name,
+                'dtype': np.dtype(dtype).name,
+                'ms': seconds * 1e3,
+                'GB/s': moved / seconds / 1e9
+            })
+
+    return results
+
+
+def peak_memory(fn):
+    """
+    Peak memory in bytes allocated while running fn()
+
+    NumPy reports its array allocations to tracemalloc, so this
+    measures the temporaries a layer creates
+    """
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+def keras_conv(A, W, b, padding, stride, dZ):
+    """
+    Reference output and gradients from K.layers.Conv2D
+
+    Returns:
+    Z, dA_prev, dW, db computed by TensorFlow
+    """
+    import tensorflow as tf
+    from tensorflow import keras as K
+
+    layer = K.layers.Conv2D(
+        filters=W.shape[3],
+        kernel_size=W.shape[:2],
+        strides=stride,
+        padding=padding
+    )
+    layer.build(A.shape)
+    layer.set_weights([W, b.reshape(-1)])
+
+    A_tf = tf.constant(A)
+    with tf.GradientTape() as tape:
+        tape.watch(A_tf)
+        Z = layer(A_tf)
+        loss = tf.reduce_sum(Z * dZ)
+    dA, dW, db = tape.gradient(loss, [A_tf] + layer.trainable_weights)
+
+    return Z.numpy(), dA.numpy(), dW.numpy(), db.numpy().reshape(b.shape)
+
+
+def keras_pool(A, kernel, stride, dA):
+    """
+    Reference output and gradient from K.layers.MaxPooling2D
+
+    Returns:
+    P, dA_prev computed by TensorFlow
+    """
+    import tensorflow as tf
+    from tensorflow import keras as K
+
+    layer = K.layers.MaxPooling2D(pool_size=kernel, strides=stride)
+    A_tf = tf.constant(A)
+    with tf.GradientTape() as tape:
+        tape.watch(A_tf)
+        P = layer(A_tf)
+        loss = tf.reduce_sum(P * dA)
+
+    return P.numpy(), tape.gradient(loss, A_tf).numpy()
+
+
+def max_error(ours, reference):
+    """Largest absolute difference between two lists of arrays"""
+    return float(max(
+        np.max(np.abs(x - y)) for x, y in zip(ours, reference)
+    ))
+
+
+def measure(fn, flops, repeat):
+    """
+    Times fn and records its memory peak
+
+    Returns:
+    dict with ms/op, GFLOP/s and peak memory in MiB
+    """
+    seconds = time_op(fn, repeat)
+
+    return {
+        'ms': seconds * 1e3,
+        'gflops': flops / seconds / 1e9,
+        'peak_mib': peak_memory(fn) / 2 ** 20
+    }
+
+
+def bench_conv(m, hw, c, kernel, stride, padding="valid", repeat=3,
+               keras=True, seed=0):
+    """
+    Benchmarks conv_forward and conv_backward for one configuration
+
+    m, hw, c: batch size, spatial size and channels of the input
+        (the layer maps c channels to 2 * c)
+    kernel: square kernel size
+    stride: stride along both axes
+    padding: "same" or "valid"
+    repeat: number of timed runs per measurement
+    keras: whether to check parity against K.layers.Conv2D
+    seed: seed of the random inputs
+
+    Returns:
+    list with one result dict for the forward and one for the backward
+    pass, or an empty list when the kernel does not fit
+    """
+    if kernel > hw:
+        return []
+
+    rng = np.random.default_rng(seed)
+    c_new = 2 * c
+    A = rng.standard_normal((m, hw, hw, c)).astype(np.float32)
+    W = rng.standard_normal((kernel, kernel, c, c_new)).astype(np.float32)
+    b = rng.standard_normal((1, 1, 1, c_new)).astype(np.float32)
+    strides = (stride, stride)
+
+    Z = conv_forward(A, W, b, lambda x: x, padding, strides)
+    dZ = rng.standard_normal(Z.shape).astype(np.float32)
+    _, h_out, w_out, _ = Z.shape
+    flops = 2 * m * h_out * w_out * c_new * kernel * kernel * c
+
+    config = {'m': m, 'hw': hw, 'c': c, 'c_new': c_new,
+              'kernel': kernel, 'stride': stride, 'padding': padding,
+              'dtype': A.dtype.name}
+    forward = dict(config, layer='conv', direction='forward', **measure(
+        lambda: conv_forward(A, W, b, lambda x: x, padding, strides),
+        flops, repeat
+    ))
+    backward = dict(config, layer='conv', direction='backward', **measure(
+        lambda: conv_backward(dZ, A, W, b, padding, strides),
+        2 * flops, repeat
+    ))
+
+    # Keras pads 'same' asymmetrically, so only compare where the
+    # padding conventions agree
+    comparable = padding == "valid" or (stride == 1 and kernel % 2 == 1)
+    forward['keras_error'] = backward['keras_error'] = None
+    if keras and comparable:
+        ref = keras_conv(A, W, b, padding, strides, dZ)
+        ours = conv_backward(dZ, A, W, b, padding, strides)
+        forward['keras_error'] = max_error([Z], ref[:1])
+        backward['keras_error'] = max_error(ours, ref[1:])
+
+    return [forward, backward]
+
+
+def bench_pool(m, hw, c, kernel, stride, repeat=3, keras=True, seed=0):
+    """
+    Benchmarks max pool_forward and pool_backward for one configuration
+
+    m, hw, c: batch size, spatial size and channels of the input
+    kernel: square window size
+    stride: stride along both axes
+    repeat: number of timed runs per measurement
+    keras: whether to check parity against K.layers.MaxPooling2D
+    seed: seed of the random inputs
+
+    Returns:
+    list with one result dict for the forward and one for the backward
+    pass, or an empty list when the window does not fit
+    """
+    if kernel > hw:
+        return []
+
+    rng = np.random.default_rng(seed)
+    A = rng.standard_normal((m, hw, hw, c)).astype(np.float32)
+    shape = (kernel, kernel)
+    strides = (stride, stride)
+
+    P = pool_forward(A, shape, strides)
+    dA = rng.standard_normal(P.shape).astype(np.float32)
+    flops = P.size * kernel * kernel
+
+    config = {'m': m, 'hw': hw, 'c': c, 'c_new': c,
+              'kernel': kernel, 'stride': stride, 'padding': 'valid',
+              'dtype': A.dtype.name}
+    forward = dict(config, layer='pool', direction='forward', **measure(
+        lambda: pool_forward(A, shape, strides), flops, repeat
+    ))
+    backward = dict(config, layer='pool', direction='backward', **measure(
+        lambda: pool_backward(dA, A, shape, strides), flops, repeat
+    ))
+
+    forward['keras_error'] = backward['keras_error'] = None
+    if keras:
+        P_ref, dA_ref = keras_pool(A, shape, strides, dA)
+        forward['keras_error'] = max_error([P], [P_ref])
+        backward['keras_error'] = max_error(
+            [pool_backward(dA, A, shape, strides)], [dA_ref]
+        )
+
+    return [forward, backward]
+
+
+def run_sweep(grid, repeat=3, keras=True):
+    """
+    Runs bench_conv and bench_pool over every point of a sweep grid
+
+    grid: dict of lists keyed by m, hw, c, kernel, stride and padding
+        (padding only applies to the conv layer)
+    repeat: number of timed runs per measurement
+    keras: whether to check parity against the Keras layers
+
+    Returns:
+    list of result dicts
+    """
+    results = []
+    for m, hw, c, kernel, stride in itertools.product(
+            grid['m'], grid['hw'], grid['c'], grid['kernel'],
+            grid['stride']):
+        for padding in grid['padding']:
+            results += bench_conv(m, hw, c, kernel, stride, padding,
+                                  repeat=repeat, keras=keras)
+        results += bench_pool(m, hw, c, kernel, stride, repeat=repeat,
+                              keras=keras)
+
+    return results
+
+
+def result_key(row):
+    """Identifies a benchmark configuration across runs"""
+    return (row['layer'], row['direction'], row['m'], row['hw'],
+            row['c'], row['kernel'], row['stride'], row['padding'])
+
+
+def over_tolerance(row, tol=None):
+    """
+    Whether a result's Keras error exceeds the tolerance
+
+    row: result dict
+    tol: tolerance, or None for TOLERANCE of the row's dtype
+
+    Returns:
+    True when parity was checked and failed
+    """
+    if row['keras_error'] is None:
+        return False
+    if tol is None:
+        tol = TOLERANCE[row.get('dtype', 'float32')]
+
+    return row['keras_error'] > tol
+
+
+def git_commit():
+    """Current git commit hash, or None outside of a git checkout"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None, tol=None):
+    """
+    Prints the results as a table, with the speedup over `baseline`
+    (results loaded from an earlier JSON file) when given; rows over
+    the Keras tolerance `tol` (see over_tolerance) are flagged
+    """
+    previous = {}
+    if baseline is not None:
+        previous = {result_key(row): row for row in baseline['results']}
+
+    print("{:<5} {:<8} {:>4} {:>3} {:>3} {:>2} {:>2} {:<5} {:>9} {:>8} "
+          "{:>8} {:>9} {:>7}".format('layer', 'pass', 'm', 'hw', 'c', 'k',
+                                     's', 'pad', 'ms/op', 'GFLOP/s', 'MiB',
+                                     'keras err', 'speedup'))
+    for row in results:
+        old = previous.get(result_key(row))
+        error = row['keras_error']
+        print("{:<5} {:<8} {:>4} {:>3} {:>3} {:>2} {:>2} {:<5} {:>9.3f} "
+              "{:>8.2f} {:>8.2f} {:>9} {:>7}".format(
+                  row['layer'], row['direction'], row['m'], row['hw'],
+                  row['c'], row['kernel'], row['stride'], row['padding'],
+                  row['ms'],
+                  row['gflops'], row['peak_mib'],
+                  '-' if error is None else '{:.1e}'.format(error),
+                  '-' if old is None else '{:.2f}x'.format(
+                      old['ms'] / row['ms'])
+              ) + ('  (over tol)' if over_tolerance(row, tol) else ''))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sweep', choices=sorted(SWEEPS), default='quick',
+                        help="sweep grid to run")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="timed runs per measurement")
+    parser.add_argument('--no-keras', action='store_true',
+                        help="skip the parity check against Keras")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="JSON results to compare with")
+    parser.add_argument('--dtype', action='store_true',
+                        help="only compare float64 and float32 layers")
+    parser.add_argument('--tol', type=float,
+                        help="largest Keras error accepted (default: "
+                        "1e-4 for float64, 1e-2 for float32)")
+    args = parser.parse_args()
+
+    if args.dtype:
+        print("{:<14} {:<8} {:>10} {:>8}".format(
+            'layer', 'dtype', 'ms/op', 'GB/s'
+        ))
+        for row in bench_dtype(repeat=args.repeat):
+            print("{:<14} {:<8} {:>10.3f} {:>8.2f}".format(
+                row['layer'], row['dtype'], row['ms'], row['GB/s']
+            ))
+    else:
+        keras = not args.no_keras
+        if keras:
+            try:
+                import tensorflow  # noqa: F401
+            except ImportError:
+                print("TensorFlow is not installed, skipping parity")
+                keras = False
+
+        results = run_sweep(SWEEPS[args.sweep], args.repeat, keras)
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        print_results(results, baseline, args.tol)
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({
+                    'commit': git_commit(),
+                    'sweep': args.sweep,
+                    'results': results
+                }, f, indent=2)
+
+        failed = sum(over_tolerance(row, args.tol) for row in results)
+        if failed:
+            print("{} results exceed the Keras tolerance".format(failed))
+            sys.exit(1)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""dtype policy for the NumPy cnn layers"""
+
+import numpy as np
+
+
+def compute_dtype(A, dtype=None):
+    """
+    dtype a layer computes and stores its results in
+
+    A: input activations of the layer
+    dtype: explicit dtype requested by the caller, or None
+
+    Returns:
+    `dtype` when given, otherwise the floating dtype of A (so float32
+    activations stay float32 whatever the weights are), and float64
+    for integer inputs
+    """
+    if dtype is not None:
+        return np.dtype(dtype)
+    if np.issubdtype(A.dtype, np.floating):
+        return A.dtype
+
+    return np.dtype(np.float64)
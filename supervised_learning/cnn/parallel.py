@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Batch sharding of the NumPy cnn layers over a thread pool"""
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# workers -> ThreadPoolExecutor, reused across layer calls
+_executors = {}
+
+
+def batch_slices(m, workers):
+    """
+    Splits a batch of m examples into contiguous shards
+
+    m: number of examples
+    workers: number of shards wanted
+
+    Returns:
+    list of (start, end) bounds, at most min(m, workers) of them
+    """
+    n = min(m, workers)
+    bounds = np.linspace(0, m, n + 1).astype(int)
+
+    return [(bounds[k], bounds[k + 1]) for k in range(n)]
+
+
+def map_shards(fn, m, workers):
+    """
+    Runs fn(k, start, end) for every shard of the batch on a thread pool
+
+    NumPy and BLAS release the GIL, so the shards run on separate
+    cores; set the BLAS thread count to 1 to avoid oversubscription
+
+    fn: callable taking the shard index and its batch bounds
+    m: number of examples
+    workers: number of threads
+
+    Returns:
+    list of the results of fn, in shard order
+    """
+    executor = _executors.get(workers)
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        _executors[workers] = executor
+
+    slices = batch_slices(m, workers)
+    futures = [
+        executor.submit(fn, k, start, end)
+        for k, (start, end) in enumerate(slices)
+    ]
+
+    return [future.result() for future in futures]
+
+
+def shard_caches(cache, n):
+    """
+    Per-shard cache dicts kept under cache['shards']
+
+    cache: cache dict handed to the layer function, or None
+    n: number of shards
+
+    Returns:
+    list of n dicts (or Nones when cache is None)
+    """
+    if cache is None:
+        return [None] * n
+
+    shards = cache.get('shards')
+    if shards is None or len(shards) != n:
+        shards = [{} for _ in range(n)]
+        cache['shards'] = shards
+
+    return shards
+
+
+def shard_workspaces(workspace, n):
+    """
+    Per-shard child workspaces of `workspace` (or Nones without one)
+    """
+    if workspace is None:
+        return [None] * n
+
+    return [workspace.shard(k) for k in range(n)]
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+van Herk/Gil-Werman sliding-window maxima for max pooling
+
+A copy of running_max from math/convolutions_and_pooling/running_max.py
+that takes its scratch and output buffers from a Workspace. Every
+project directory is self-contained (its scripts __import__ their
+siblings from that directory), so neither copy can load the other; any
+fix to running_max must be made in both files
+"""
+
+import numpy as np
+get_buffer = __import__('workspace').get_buffer
+
+
+def running_max(x, k, axis, stride=1, workspace=None, name='running'):
+    """
+    Maximum of every k-long window along one axis
+
+    The axis is cut into blocks of k; a forward and a backward running
+    maximum are taken inside every block, and the window starting at i
+    is max(backward[i], forward[i + k - 1]): about three comparisons
+    per element whatever k is
+
+    x: input array
+    k: window length
+    axis: axis the window slides along
+    stride: step between windows
+    workspace: optional Workspace for the scratch and output buffers
+    name: prefix of the workspace buffers, so several passes can share
+        a workspace
+
+    Returns:
+    array like x with (n - k) // stride + 1 elements along axis
+    """
+    axis %= x.ndim
+    n = x.shape[axis]
+    n_out = (n - k) // stride + 1
+    blocks = -(-n // k)
+    before, after = x.shape[:axis], x.shape[axis + 1:]
+
+    if np.issubdtype(x.dtype, np.floating):
+        lowest = -np.inf
+    else:
+        lowest = np.iinfo(x.dtype).min
+    padded = get_buffer(workspace, name + '_padded',
+                        before + (blocks, k) + after, x.dtype)
+    padded.fill(lowest)
+    flat = padded.reshape(before + (blocks * k,) + after)
+    flat[(slice(None),) * axis + (slice(0, n),)] = x
+
+    # Running maxima inside every block, forwards into a copy and
+    # backwards in place
+    forward = get_buffer(workspace, name + '_forward', padded.shape,
+                         x.dtype)
+    np.copyto(forward, padded)
+    lead = (slice(None),) * (axis + 1)
+    for j in range(1, k):
+        np.maximum(forward[lead + (j - 1,)], forward[lead + (j,)],
+                   out=forward[lead + (j,)])
+    for j in range(k - 2, -1, -1):
+        np.maximum(padded[lead + (j + 1,)], padded[lead + (j,)],
+                   out=padded[lead + (j,)])
+    forward = forward.reshape(flat.shape)
+
+    last = stride * (n_out - 1) + 1
+    lead = (slice(None),) * axis
+    out = get_buffer(workspace, name + '_out', before + (n_out,) + after,
+                     x.dtype)
+
+    return np.maximum(flat[lead + (slice(0, last, stride),)],
+                      forward[lead + (slice(k - 1, k - 1 + last, stride),)],
+                      out=out)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Reusable buffer arena for the NumPy cnn layers"""
+
+import numpy as np
+
+
+class Workspace:
+    """
+    Keeps preallocated buffers keyed by name, shape and dtype
+
+    Give every layer its own workspace: the arrays returned by a layer
+    function that received a workspace live in its buffers and are
+    overwritten by the next call made with the same workspace.
+    """
+
+    def __init__(self):
+        """Initializes an empty workspace"""
+        self.buffers = {}
+        self.shards = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, shape, dtype=np.float64):
+        """
+        Returns the buffer for (name, shape, dtype)
+
+        name: any hashable tag for the buffer
+        shape: shape of the buffer
+        dtype: dtype of the buffer
+
+        A missing buffer is allocated zero-filled, otherwise the stored
+        one is returned as is
+        """
+        key = (name, tuple(shape), np.dtype(dtype))
+        buf = self.buffers.get(key)
+
+        if buf is None:
+            self.misses += 1
+            buf = np.zeros(shape, dtype=dtype)
+            self.buffers[key] = buf
+        else:
+            self.hits += 1
+
+        return buf
+
+    def shard(self, index):
+        """
+        Returns the child workspace used by batch shard `index`
+        """
+        child = self.shards.get(index)
+        if child is None:
+            child = Workspace()
+            self.shards[index] = child
+
+        return child
+
+    def stats(self):
+        """
+        Returns a dict with the hit and miss counters, the number of
+        buffers held and their total size in bytes, shards included
+        """
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'buffers': len(self.buffers),
+            'bytes': sum(buf.nbytes for buf in self.buffers.values())
+        }
+        for child in self.shards.values():
+            for key, value in child.stats().items():
+                stats[key] += value
+
+        return stats
+
+    def reset_stats(self):
+        """Resets the hit and miss counters"""
+        self.hits = 0
+        self.misses = 0
+        for child in self.shards.values():
+            child.reset_stats()
+
+    def clear(self):
+        """Drops every buffer and shard and resets the counters"""
+        self.buffers = {}
+        self.shards = {}
+        self.reset_stats()
+
+
+def get_buffer(workspace, name, shape, dtype=np.float64):
+    """
+    Buffer from `workspace`, or a fresh uninitialized array without one
+    """
+    if workspace is None:
+        return np.empty(shape, dtype=dtype)
+
+    return workspace.get(name, shape, dtype)
+
+
+def pad_input(A, pad_h, pad_w, workspace=None, name='A_pad'):
+    """
+    Zero-pads the height and width of a (m, h, w, c) batch
+
+    A: (m, h, w, c)
+    pad_h: (top, bottom) padding
+    pad_w: (left, right) padding
+    workspace: optional Workspace holding the padded buffer; its
+        border is zeroed once on allocation and only the interior is
+        rewritten afterwards
+    name: tag of the padded buffer in the workspace
+
+    Returns:
+    (m, top + h + bottom, left + w + right, c) padded batch, or A
+    itself when there is nothing to pad
+    """
+    (top, bottom), (left, right) = pad_h, pad_w
+    if top == bottom == left == right == 0:
+        return A
+
+    if workspace is None:
+        return np.pad(
+            A,
+            ((0, 0), (top, bottom), (left, right), (0, 0)),
+            mode='constant'
+        )
+
+    m, h, w, c = A.shape
+    A_pad = workspace.get(
+        (name, top, bottom, left, right),
+        (m, top + h + bottom, left + w + right, c),
+        A.dtype
+    )
+    A_pad[:, top:top + h, left:left + w, :] = A
+
+    return A_pad
@@ -1,10 +1,211 @@
 #!/usr/bin/env python3
 """Module for YOLO v3 object detection."""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import json
 import numpy as np
 import tensorflow.keras as K
 import cv2
 import os
 
+# Rows of the pairwise IOU matrix computed at once by suppress_blocks; a
+# multiple of 8 so every block starts on a byte of the bitmasks
+NMS_BLOCK = 64
+
+# Gray level of the bars around letterboxed images
+LETTERBOX_FILL = 128
+
+# Anchor boxes of the Darknet YOLO v3 model trained on COCO
+ANCHORS = np.array([[[116, 90], [156, 198], [373, 326]],
+                    [[30, 61], [62, 45], [59, 119]],
+                    [[10, 13], [16, 30], [33, 23]]])
+
+
+def sigmoid(x):
+    """Logistic sigmoid computed into a single new array.
+
+    Args:
+        x (numpy.ndarray): Logits.
+
+    Returns:
+        numpy.ndarray: 1 / (1 + exp(-x)), same dtype as x.
+    """
+    out = np.negative(x)
+    np.exp(out, out=out)
+    out += 1
+    return np.reciprocal(out, out=out)
+
+
+def decode_boxes(t, cx, cy, sx, sy, half_w, half_h, image_height,
+                 image_width):
+    """Turn raw box predictions into corners in image pixels.
+
+    All the arguments broadcast against t[..., 0], so the same code
+    decodes full grids and gathered candidates.
+
+    Args:
+        t (numpy.ndarray): Shape (..., 4) raw (t_x, t_y, t_w, t_h).
+        cx, cy: Cell offsets divided by the grid size.
+        sx, sy: 1 / grid width and 1 / grid height.
+        half_w, half_h: Anchor sizes divided by twice the input size.
+        image_height, image_width: Original image sizes.
+
+    Returns:
+        numpy.ndarray: float32 array of shape (..., 4) with the boxes
+            (x1, y1, x2, y2).
+    """
+    image_height = np.asarray(image_height, dtype=np.float32)
+    image_width = np.asarray(image_width, dtype=np.float32)
+    boxes = np.empty(t.shape, dtype=np.float32)
+
+    # Box centers and half sizes in image pixels, then the corners
+    bx = sigmoid(t[..., 0])
+    bx *= sx
+    bx += cx
+    bx *= image_width
+    box_half_w = np.exp(t[..., 2])
+    box_half_w *= half_w
+    box_half_w *= image_width
+    np.subtract(bx, box_half_w, out=boxes[..., 0])
+    np.add(bx, box_half_w, out=boxes[..., 2])
+
+    by = sigmoid(t[..., 1])
+    by *= sy
+    by += cy
+    by *= image_height
+    box_half_h = np.exp(t[..., 3])
+    box_half_h *= half_h
+    box_half_h *= image_height
+    np.subtract(by, box_half_h, out=boxes[..., 1])
+    np.add(by, box_half_h, out=boxes[..., 3])
+
+    return boxes
+
+
+def letterbox_geometry(image_height, image_width, input_h, input_w):
+    """Where a letterboxed image lands in the model input.
+
+    The image is scaled by the same factor along both axes so that it
+    fits the input, and centered; the rest of the input is filled with
+    LETTERBOX_FILL.
+
+    Args:
+        image_height, image_width: Original image sizes, scalars or
+            arrays.
+        input_h, input_w (int): Input size of the model.
+
+    Returns:
+        tuple: (new_h, new_w, top, left) integer arrays shaped like the
+            image sizes: size of the resized image and offset of its
+            top-left corner in the input.
+    """
+    image_height = np.asarray(image_height)
+    image_width = np.asarray(image_width)
+    scale = np.minimum(input_h / image_height, input_w / image_width)
+    new_h = np.minimum(np.rint(image_height * scale), input_h).astype(int)
+    new_w = np.minimum(np.rint(image_width * scale), input_w).astype(int)
+
+    return new_h, new_w, (input_h - new_h) // 2, (input_w - new_w) // 2
+
+
+def unletterbox_boxes(boxes, image_height, image_width, input_h, input_w):
+    """Map boxes from letterboxed input pixels back to the original image.
+
+    Args:
+        boxes (numpy.ndarray): Shape (..., 4) boxes (x1, y1, x2, y2) in
+            pixels of the model input; modified in place.
+        image_height, image_width: Original image sizes, broadcasting
+            against boxes[..., 0].
+        input_h, input_w (int): Input size of the model.
+
+    Returns:
+        numpy.ndarray: boxes, in original image pixels.
+    """
+    new_h, new_w, top, left = letterbox_geometry(
+        image_height, image_width, input_h, input_w
+    )
+    # The effective scale of each axis, after rounding the resized size
+    scale_x = (np.asarray(image_width) / new_w).astype(boxes.dtype)
+    scale_y = (np.asarray(image_height) / new_h).astype(boxes.dtype)
+
+    for axis, offset, scale in ((0, left, scale_x), (1, top, scale_y)):
+        corners = boxes[..., axis::2]
+        corners -= np.asarray(offset, dtype=boxes.dtype)[..., np.newaxis]
+        corners *= scale[..., np.newaxis]
+
+    return boxes
+
+
+def pairwise_iou(boxes, areas, others, other_areas):
+    """IOU of every box with the box in the same row of `others`.
+
+    Args:
+        boxes, others (numpy.ndarray): Shape (?, 4) boxes (x1, y1, x2, y2)
+            of the same length, or broadcastable against each other.
+        areas, other_areas (numpy.ndarray): Their areas.
+
+    Returns:
+        numpy.ndarray: IOU of each pair.
+    """
+    x1 = np.maximum(boxes[..., 0], others[..., 0])
+    y1 = np.maximum(boxes[..., 1], others[..., 1])
+    x2 = np.minimum(boxes[..., 2], others[..., 2])
+    y2 = np.minimum(boxes[..., 3], others[..., 3])
+
+    intersection = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+    union = areas + other_areas - intersection
+
+    return intersection / union
+
+
+def suppress_blocks(boxes, areas, classes, nms_t):
+    """Greedy non-max suppression over blocks of a pairwise IOU matrix.
+
+    The boxes are swept in order, NMS_BLOCK rows at a time. The IOU rows
+    of a block are only computed for the boxes no earlier kept box has
+    suppressed, against the later boxes up to the end of their class,
+    and packed into bitmasks that are ORed into the suppressed set.
+
+    Args:
+        boxes (numpy.ndarray): Shape (n, 4), sorted by class and then by
+            decreasing score.
+        areas (numpy.ndarray): Shape (n,) areas of the boxes.
+        classes (numpy.ndarray): Shape (n,) sorted classes of the boxes.
+        nms_t (float): IOU threshold.
+
+    Returns:
+        list: Indices of the kept boxes, in order.
+    """
+    n = len(boxes)
+    class_end = np.searchsorted(classes, classes, side='right')
+    removed = np.zeros((n + 7) // 8, dtype=np.uint8)
+    keep = []
+
+    for start in range(0, n, NMS_BLOCK):
+        end = min(start + NMS_BLOCK, n)
+        stop = class_end[end - 1]
+        alive = np.unpackbits(removed[start // 8:(end + 7) // 8],
+                              count=end - start)
+        alive = start + np.flatnonzero(alive == 0)
+
+        iou = pairwise_iou(boxes[alive, np.newaxis],
+                           areas[alive, np.newaxis], boxes[start:stop],
+                           areas[start:stop])
+        later = np.arange(start, stop) > alive[:, np.newaxis]
+        same = classes[start:stop] == classes[alive, np.newaxis]
+        packed = np.packbits(~(iou < nms_t) & later & same, axis=1)
+        first = start // 8
+        last = first + packed.shape[1]
+
+        for i, bits in zip(alive, packed):
+            if removed[i >> 3] & (128 >> (i & 7)):
+                continue
+            keep.append(i)
+            removed[first:last] |= bits
+
+    return keep
+
 
 class Yolo:
     """Uses the Yolo v3 algorithm to perform object detection."""
@@ -26,8 +227,71 @@ class Yolo:
         self.class_t = class_t
         self.nms_t = nms_t
         self.anchors = anchors
+        self.profiler = None
+
+    def decoder(self, i, grid_height, grid_width):
+        """Grid offsets and anchor sizes of one output scale.
+
+        In float32 and shaped to broadcast against ([batch,]
+        grid_height, grid_width, anchor_boxes) predictions. They take a
+        few microseconds to build, next to milliseconds for the
+        sigmoids of a decode, so they are not cached.
+
+        Args:
+            i (int): Index of the output scale (selects the anchors).
+            grid_height, grid_width (int): Size of the output grid.
+
+        Returns:
+            dict: cx, cy: cell offsets divided by the grid size;
+                sx, sy: 1 / grid size;
+                half_w, half_h: anchor sizes divided by twice the model
+                input size.
+        """
+        input_width = self.model.input.shape[1]
+        input_height = self.model.input.shape[2]
+        cx = np.arange(grid_width, dtype=np.float32) / grid_width
+        cy = np.arange(grid_height, dtype=np.float32) / grid_height
+
+        return {
+            'cx': cx.reshape(grid_width, 1),
+            'cy': cy.reshape(grid_height, 1, 1),
+            'sx': np.float32(1 / grid_width),
+            'sy': np.float32(1 / grid_height),
+            'half_w': (self.anchors[i, :, 0] /
+                       (2 * input_width)).astype(np.float32),
+            'half_h': (self.anchors[i, :, 1] /
+                       (2 * input_height)).astype(np.float32)
+        }
+
+    def _decode(self, i, output, image_height, image_width):
+        """Decode one output scale, for one image or a batch of images.
+
+        Args:
+            i (int): Index of the output scale (selects the anchors).
+            output (numpy.ndarray): Darknet predictions of shape
+                ([batch,] grid_height, grid_width, anchor_boxes,
+                4 + 1 + classes).
+            image_height, image_width: Original image size, scalars or
+                arrays of shape (batch, 1, 1, 1).
+
+        Returns:
+            tuple: (boxes, box_confidences, box_class_probs) shaped like
+                output with 4, 1 and classes channels.
+        """
+        grid_height, grid_width = output.shape[-4:-2]
+        table = self.decoder(i, grid_height, grid_width)
+
+        boxes = decode_boxes(
+            output[..., :4], table['cx'], table['cy'], table['sx'],
+            table['sy'], table['half_w'], table['half_h'], image_height,
+            image_width
+        )
+        box_confidences = sigmoid(output[..., 4:5])
+        box_class_probs = sigmoid(output[..., 5:])
+
+        return boxes, box_confidences, box_class_probs
 
-    def process_outputs(self, outputs, image_size):
+    def process_outputs(self, outputs, image_size, letterbox=False):
         """Process outputs from Darknet model for a single image.
 
         Args:
@@ -36,6 +300,9 @@ class Yolo:
                 (grid_height, grid_width, anchor_boxes, 4 + 1 + classes).
             image_size (numpy.ndarray): Image's original size
                 [image_height, image_width].
+            letterbox (bool): Whether the image was letterboxed by
+                preprocess_images; the boxes are then mapped back from
+                the letterbox to the original image.
 
         Returns:
             tuple: (boxes, box_confidences, box_class_probs)
@@ -52,42 +319,22 @@ class Yolo:
         box_class_probs = []
 
         image_height, image_width = image_size
-
-        input_width = self.model.input.shape[1]
-        input_height = self.model.input.shape[2]
+        input_h = self.model.input.shape[1]
+        input_w = self.model.input.shape[2]
 
         for i, output in enumerate(outputs):
-            grid_height, grid_width, anchor_boxes, _ = output.shape
-
-            t_x = output[..., 0]
-            t_y = output[..., 1]
-            t_w = output[..., 2]
-            t_h = output[..., 3]
-
-            pw = self.anchors[i, :, 0]
-            ph = self.anchors[i, :, 1]
-
-            cx = np.arange(grid_width).reshape(1, grid_width, 1)
-            cy = np.arange(grid_height).reshape(grid_height, 1, 1)
-
-            bx = (1 / (1 + np.exp(-t_x)) + cx) / grid_width
-            by = (1 / (1 + np.exp(-t_y)) + cy) / grid_height
-
-            bw = (pw * np.exp(t_w)) / input_width
-            bh = (ph * np.exp(t_h)) / input_height
-
-            x1 = (bx - bw / 2) * image_width
-            y1 = (by - bh / 2) * image_height
-            x2 = (bx + bw / 2) * image_width
-            y2 = (by + bh / 2) * image_height
-
-            box = np.stack([x1, y1, x2, y2], axis=-1)
+            if letterbox:
+                box, confidence, class_probs = self._decode(
+                    i, output, input_h, input_w
+                )
+                unletterbox_boxes(box, image_height, image_width, input_h,
+                                  input_w)
+            else:
+                box, confidence, class_probs = self._decode(
+                    i, output, image_height, image_width
+                )
             boxes.append(box)
-
-            confidence = 1 / (1 + np.exp(-output[..., 4:5]))
             box_confidences.append(confidence)
-
-            class_probs = 1 / (1 + np.exp(-output[..., 5:]))
             box_class_probs.append(class_probs)
 
         return boxes, box_confidences, box_class_probs
@@ -137,7 +384,92 @@ class Yolo:
 
         return filtered_boxes, box_classes, box_scores
 
-    def non_max_suppression(self, filtered_boxes, box_classes, box_scores):
+    def filter_batch(self, model_outputs, image_shapes, letterbox=False):
+        """Decode and filter the boxes of a whole batch in one pass.
+
+        Equivalent to process_outputs followed by filter_boxes for every
+        image, but score-first: a box score is at most the box
+        confidence, so the class probabilities are only computed for
+        anchors whose confidence reaches class_t, and the box geometry
+        only for the anchors that pass the filter.
+
+        Args:
+            model_outputs (list): numpy.ndarrays of shape
+                (batch, grid_height, grid_width, anchor_boxes,
+                4 + 1 + classes), one per output scale.
+            image_shapes (numpy.ndarray): Shape (batch, 2) containing the
+                original [image_height, image_width] of every image.
+            letterbox (bool): Whether the images were letterboxed by
+                preprocess_images.
+
+        Returns:
+            tuple: (filtered_boxes, box_classes, box_scores, offsets)
+                filtered_boxes, box_classes, box_scores: the filtered
+                    boxes of all images, grouped by image in the order
+                    filter_boxes returns them for each image.
+                offsets: numpy.ndarray of shape (batch + 1,); the results
+                    of image i are the rows offsets[i]:offsets[i + 1].
+        """
+        batch = len(image_shapes)
+        input_h = self.model.input.shape[1]
+        input_w = self.model.input.shape[2]
+        if letterbox:
+            decode_shapes = np.broadcast_to([input_h, input_w], (batch, 2))
+        else:
+            decode_shapes = image_shapes
+
+        filtered_boxes = []
+        box_classes = []
+        box_scores = []
+        box_images = []
+
+        for i, output in enumerate(model_outputs):
+            grid_height, grid_width = output.shape[-4:-2]
+            table = self.decoder(i, grid_height, grid_width)
+
+            confidences = sigmoid(output[..., 4])
+            candidates = np.nonzero(confidences >= self.class_t)
+            predictions = output[candidates]
+
+            scores = sigmoid(predictions[:, 5:])
+            scores *= confidences[candidates][:, np.newaxis]
+            best_class = np.argmax(scores, axis=-1)
+            best_score = np.take_along_axis(
+                scores, best_class[:, np.newaxis], axis=-1
+            )[:, 0]
+
+            mask = best_score >= self.class_t
+            image, y, x, anchor = (index[mask] for index in candidates)
+
+            boxes = decode_boxes(
+                predictions[mask, :4], table['cx'][x, 0],
+                table['cy'][y, 0, 0], table['sx'], table['sy'],
+                table['half_w'][anchor], table['half_h'][anchor],
+                decode_shapes[image, 0], decode_shapes[image, 1]
+            )
+            if letterbox:
+                unletterbox_boxes(boxes, image_shapes[image, 0],
+                                  image_shapes[image, 1], input_h, input_w)
+            filtered_boxes.append(boxes)
+            box_classes.append(best_class[mask])
+            box_scores.append(best_score[mask])
+            box_images.append(image)
+
+        # Group by image; the stable sort keeps scale and grid order
+        box_images = np.concatenate(box_images, axis=0)
+        order = np.argsort(box_images, kind='stable')
+        filtered_boxes = np.concatenate(filtered_boxes, axis=0)[order]
+        box_classes = np.concatenate(box_classes, axis=0)[order]
+        box_scores = np.concatenate(box_scores, axis=0)[order]
+
+        offsets = np.zeros(batch + 1, dtype=np.int64)
+        np.cumsum(np.bincount(box_images, minlength=batch),
+                  out=offsets[1:])
+
+        return filtered_boxes, box_classes, box_scores, offsets
+
+    def non_max_suppression(self, filtered_boxes, box_classes, box_scores,
+                            method="vectorized"):
         """Apply non-max suppression to eliminate redundant overlapping boxes.
 
         Args:
@@ -147,6 +479,11 @@ class Yolo:
                 number for each filtered box.
             box_scores (numpy.ndarray): Shape (?,) containing the box
                 score for each filtered box.
+            method (str): "vectorized" suppresses all classes together
+                in rounds, and finishes sparse scenes on blocks of a
+                pairwise IOU matrix (see suppress_blocks); "loop" uses
+                the reference per-class loop. Both return the same boxes
+                in the same order.
 
         Returns:
             tuple: (box_predictions, predicted_box_classes,
@@ -158,6 +495,61 @@ class Yolo:
                 predicted_box_scores: numpy.ndarray of shape (?,) with
                     box scores ordered by class and score.
         """
+        if method == "loop":
+            return self._nms_loop(filtered_boxes, box_classes, box_scores)
+        if method != "vectorized":
+            raise ValueError("method must be 'vectorized' or 'loop'")
+
+        # By class, then by decreasing score, ties in reversed index
+        # order like the stable argsort(...)[::-1] of the loop
+        order = np.lexsort((box_scores, -box_classes))[::-1]
+        boxes = filtered_boxes[order]
+        classes = box_classes[order]
+        scores = box_scores[order]
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+        # All classes in lockstep: every round keeps the best remaining
+        # box of each class and drops the boxes it overlaps
+        keep = np.zeros(len(scores), dtype=bool)
+        alive = np.arange(len(scores))
+        while len(alive):
+            alive_classes = classes[alive]
+            first = np.empty(len(alive), dtype=bool)
+            first[0] = True
+            np.not_equal(alive_classes[1:], alive_classes[:-1],
+                         out=first[1:])
+            heads = alive[first]
+            keep[heads] = True
+
+            best = heads[np.cumsum(first) - 1][~first]
+            rest = alive[~first]
+            iou = pairwise_iou(boxes[best], areas[best], boxes[rest],
+                               areas[rest])
+            alive = rest[iou < self.nms_t]
+
+            # Sparse scenes suppress little per round: finish with the
+            # blocked IoU matrix instead of one round per kept box
+            if len(rest) - len(alive) < len(heads):
+                keep[alive[suppress_blocks(boxes[alive], areas[alive],
+                                           classes[alive], self.nms_t)]] = (
+                    True
+                )
+                break
+
+        return boxes[keep], classes[keep], scores[keep]
+
+    def _nms_loop(self, filtered_boxes, box_classes, box_scores):
+        """Reference per-class non-max suppression loop.
+
+        Args:
+            filtered_boxes (numpy.ndarray): Shape (?, 4) filtered boxes.
+            box_classes (numpy.ndarray): Shape (?,) class of every box.
+            box_scores (numpy.ndarray): Shape (?,) score of every box.
+
+        Returns:
+            tuple: (box_predictions, predicted_box_classes,
+                predicted_box_scores) as in non_max_suppression.
+        """
         box_predictions = []
         predicted_box_classes = []
         predicted_box_scores = []
@@ -169,7 +561,7 @@ class Yolo:
             cls_boxes = filtered_boxes[cls_mask]
             cls_scores = box_scores[cls_mask]
 
-            order = np.argsort(cls_scores)[::-1]
+            order = np.argsort(cls_scores, kind="stable")[::-1]
             cls_boxes = cls_boxes[order]
             cls_scores = cls_scores[order]
 
@@ -249,17 +641,32 @@ class Yolo:
 
         return images, image_paths
 
-    def preprocess_images(self, images):
+    def preprocess_images(self, images, letterbox=False, dtype=None,
+                          out=None):
         """Resize and normalize images for input into the Darknet model.
 
+        Every image is resized straight into one batch buffer, without
+        per-image float temporaries.
+
         Args:
             images (list): List of images as numpy.ndarrays.
+            letterbox (bool): Keep the aspect ratio of the images: each
+                one is scaled to fit the input and centered on a
+                LETTERBOX_FILL background. The model outputs must then
+                be decoded with letterbox=True.
+            dtype (numpy.dtype): dtype of the batch; float dtypes hold
+                pixel values in [0, 1], uint8 the raw pixel values for a
+                model that normalizes its input (see fuse_normalization).
+                Defaults to the input dtype of the model.
+            out (numpy.ndarray): Buffer of shape (>= ni, input_h,
+                input_w, 3) to write the batch into, so it can be reused
+                across calls; its dtype takes precedence over dtype.
 
         Returns:
             tuple: (pimages, image_shapes)
                 pimages: numpy.ndarray of shape (ni, input_h, input_w, 3)
-                    containing all preprocessed images with pixel values
-                    in the range [0, 1].
+                    containing all preprocessed images (a view of out
+                    when given).
                 image_shapes: numpy.ndarray of shape (ni, 2) containing
                     the original height and width of each image as
                     [image_height, image_width].
@@ -267,36 +674,92 @@ class Yolo:
         input_h = self.model.input.shape[1]
         input_w = self.model.input.shape[2]
 
-        pimages = []
-        image_shapes = []
+        if out is None:
+            if dtype is None:
+                dtype = self.model.input.dtype
+            out = np.empty((len(images), input_h, input_w, 3), dtype=dtype)
+        pimages = out[:len(images)]
+
+        for image, pimage in zip(images, pimages):
+            self._normalize(
+                self._resize_image(image, input_h, input_w, letterbox),
+                pimage
+            )
+
+        image_shapes = np.array([image.shape[:2] for image in images])
+
+        return pimages, image_shapes
 
-        for image in images:
-            image_shapes.append(image.shape[:2])
+    @staticmethod
+    def _resize_image(image, input_h, input_w, letterbox=False):
+        """Resize one image to the input size of the Darknet model.
 
-            resized = cv2.resize(
+        Args:
+            image (numpy.ndarray): Image as read by cv2.imread.
+            input_h, input_w (int): Input size of the model.
+            letterbox (bool): Keep the aspect ratio (see
+                preprocess_images).
+
+        Returns:
+            numpy.ndarray: Shape (input_h, input_w, 3), same dtype as
+                image.
+        """
+        if not letterbox:
+            return cv2.resize(
                 image,
                 (input_w, input_h),
                 interpolation=cv2.INTER_CUBIC
             )
 
-            normalized = resized / 255.0
-            pimages.append(normalized)
+        new_h, new_w, top, left = letterbox_geometry(
+            image.shape[0], image.shape[1], input_h, input_w
+        )
+        resized = np.full((input_h, input_w, 3), LETTERBOX_FILL,
+                          dtype=image.dtype)
+        resized[top:top + new_h, left:left + new_w] = cv2.resize(
+            image,
+            (int(new_w), int(new_h)),
+            interpolation=cv2.INTER_CUBIC
+        )
 
-        pimages = np.array(pimages)
-        image_shapes = np.array(image_shapes)
+        return resized
 
-        return pimages, image_shapes
+    @staticmethod
+    def _normalize(resized, out):
+        """Write a resized uint8 image into one slot of a batch buffer.
 
-    def show_boxes(self, image, boxes, box_classes, box_scores, file_name):
-        """Display image with bounding boxes, class names, and scores.
+        Args:
+            resized (numpy.ndarray): Output of _resize_image.
+            out (numpy.ndarray): Slot of the batch buffer; uint8 slots
+                get the raw pixels, float slots pixels / 255.
+        """
+        if out.dtype == np.uint8:
+            np.copyto(out, resized)
+        else:
+            np.divide(resized, out.dtype.type(255), out=out)
+
+    def fuse_normalization(self):
+        """Move the division by 255 into the model.
+
+        The model is wrapped to take uint8 images and rescale them
+        itself, so preprocess_images and predict feed it uint8 batches
+        (4 times smaller than float32) by default.
+        """
+        inputs = K.Input(shape=self.model.input.shape[1:], dtype='uint8')
+        outputs = self.model(K.layers.Rescaling(1 / 255)(inputs))
+        self.model = K.Model(inputs, outputs)
+
+    def draw_boxes(self, image, boxes, box_classes, box_scores):
+        """Draw bounding boxes, class names, and scores on an image.
 
         Args:
             image (numpy.ndarray): Unprocessed image to annotate.
             boxes (numpy.ndarray): Boundary boxes for the image.
             box_classes (numpy.ndarray): Class indices for each box.
             box_scores (numpy.ndarray): Box scores for each box.
-            file_name (str): File path where the original image is stored.
-                Used as window name and saved file name.
+
+        Returns:
+            numpy.ndarray: Annotated copy of the image.
         """
         annotated = image.copy()
 
@@ -329,6 +792,21 @@ class Yolo:
                 cv2.LINE_AA
             )
 
+        return annotated
+
+    def show_boxes(self, image, boxes, box_classes, box_scores, file_name):
+        """Display image with bounding boxes, class names, and scores.
+
+        Args:
+            image (numpy.ndarray): Unprocessed image to annotate.
+            boxes (numpy.ndarray): Boundary boxes for the image.
+            box_classes (numpy.ndarray): Class indices for each box.
+            box_scores (numpy.ndarray): Box scores for each box.
+            file_name (str): File path where the original image is stored.
+                Used as window name and saved file name.
+        """
+        annotated = self.draw_boxes(image, boxes, box_classes, box_scores)
+
         cv2.imshow(file_name, annotated)
         key = cv2.waitKey(0)
 
@@ -339,49 +817,256 @@ class Yolo:
 
         cv2.destroyAllWindows()
 
-    def predict(self, folder_path):
-        """Run the full YOLO prediction pipeline on all images in a folder.
+    def predict_iter(self, folder_path, batch_size=32, workers=4,
+                     prefetch=2, letterbox=False, dtype=None):
+        """Stream predictions for the images in a folder.
+
+        Images are read and preprocessed by a pool of threads while the
+        model runs. At most prefetch * batch_size images are read ahead,
+        so memory stays flat however large the folder is. The model is
+        always fed batches of batch_size (the last one is zero-padded),
+        normalized into a single reused buffer. When self.profiler is
+        set (see profiler.py), every stage is timed.
 
         Args:
             folder_path (str): Path to the folder holding all images
                 to predict.
+            batch_size (int): Number of images per model call.
+            workers (int): Number of loading threads.
+            prefetch (int): Number of batches read ahead of the model.
+            letterbox (bool): Letterbox the images (see
+                preprocess_images); the boxes are still returned in
+                original image pixels.
+            dtype (numpy.dtype): dtype of the model batches. Defaults to
+                the input dtype of the model.
+
+        Yields:
+            tuple: (image_path, image, prediction) for every image in
+                folder order, where prediction is the
+                (boxes, box_classes, box_scores) tuple of predict.
+        """
+        input_h = self.model.input.shape[1]
+        input_w = self.model.input.shape[2]
+        if dtype is None:
+            dtype = self.model.input.dtype
+
+        def load(path, batch_index):
+            """Read and resize one image."""
+            with self._stage('load', batch=batch_index):
+                image = cv2.imread(path)
+            with self._stage('preprocess', batch=batch_index):
+                return image, self._resize_image(image, input_h, input_w,
+                                                 letterbox)
+
+        paths = iter(
+            os.path.join(folder_path, fname)
+            for fname in os.listdir(folder_path)
+        )
+        pending = deque()
+        pimages = np.zeros((batch_size, input_h, input_w, 3), dtype=dtype)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        submitted = 0
+
+        def top_up():
+            """Keep prefetch * batch_size images in flight."""
+            nonlocal submitted
+            while len(pending) < prefetch * batch_size:
+                path = next(paths, None)
+                if path is None:
+                    return
+                pending.append((path, executor.submit(
+                    load, path, submitted // batch_size
+                )))
+                submitted += 1
+
+        try:
+            top_up()
+            batch_index = 0
+            while pending:
+                if self.profiler is not None:
+                    self.profiler.batch = batch_index
+                batch = []
+                while pending and len(batch) < batch_size:
+                    path, future = pending.popleft()
+                    top_up()
+                    image, resized = future.result()
+                    batch.append((path, image, resized))
+                n = len(batch)
+
+                with self._stage('infer', n):
+                    for k, (_, _, resized) in enumerate(batch):
+                        self._normalize(resized, pimages[k])
+                    pimages[n:] = 0
+                    model_outputs = self.model.predict(pimages, verbose=0)
+                image_shapes = np.array([
+                    image.shape[:2] for _, image, _ in batch
+                ])
+                with self._stage('filter_batch', n):
+                    filtered_boxes, box_classes, box_scores, offsets = (
+                        self.filter_batch(
+                            [out[:n] for out in model_outputs],
+                            image_shapes, letterbox
+                        )
+                    )
+
+                predictions = []
+                with self._stage('non_max_suppression', n):
+                    for i in range(n):
+                        start, end = offsets[i], offsets[i + 1]
+                        predictions.append(self.non_max_suppression(
+                            filtered_boxes[start:end],
+                            box_classes[start:end], box_scores[start:end]
+                        ))
+
+                for (path, image, _), prediction in zip(batch, predictions):
+                    yield path, image, prediction
+                batch_index += 1
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _stage(self, name, items=1, batch=None):
+        """Profile a stage with self.profiler, if there is one.
+
+        Args:
+            name (str): Stage name.
+            items (int): Number of images the stage handles.
+            batch (int): Batch the images belong to.
 
         Returns:
-            tuple: (predictions, image_paths)
-                predictions: list of tuples (boxes, box_classes, box_scores)
-                    for each image.
-                image_paths: list of image paths corresponding to each
-                    prediction in predictions.
+            Context manager timing the stage, or doing nothing.
         """
-        images, image_paths = self.load_images(folder_path)
-        pimages, image_shapes = self.preprocess_images(images)
+        if self.profiler is None:
+            return nullcontext()
 
-        # Run batch prediction through the model
-        model_outputs = self.model.predict(pimages)
+        return self.profiler.stage(name, items, batch)
 
-        predictions = []
+    def detections(self, boxes, box_classes, box_scores):
+        """JSON-serializable detections of one image.
 
-        for i, image in enumerate(images):
-            # Gather all scale outputs for this single image
-            outputs = [out[i] for out in model_outputs]
+        Args:
+            boxes (numpy.ndarray): Boundary boxes for the image.
+            box_classes (numpy.ndarray): Class indices for each box.
+            box_scores (numpy.ndarray): Box scores for each box.
 
-            boxes, box_confidences, box_class_probs = self.process_outputs(
-                outputs, image_shapes[i]
-            )
+        Returns:
+            dict: boxes, classes (names), class_ids and scores as lists.
+        """
+        return {
+            'boxes': np.reshape(boxes, (-1, 4)).tolist(),
+            'classes': [self.class_names[c] for c in box_classes],
+            'class_ids': np.asarray(box_classes).tolist(),
+            'scores': np.asarray(box_scores).tolist()
+        }
 
-            boxes, box_classes, box_scores = self.filter_boxes(
-                boxes, box_confidences, box_class_probs
-            )
+    def write_manifest(self, path, predictions, image_paths):
+        """Write the detections of a run to a JSON or NPZ manifest.
 
-            boxes, box_classes, box_scores = self.non_max_suppression(
-                boxes, box_classes, box_scores
+        Args:
+            path (str): Manifest file; a .npz extension writes NumPy
+                arrays (image i owns rows offsets[i]:offsets[i + 1]),
+                anything else JSON.
+            predictions (list): (boxes, box_classes, box_scores) tuples.
+            image_paths (list): Image path of every prediction.
+        """
+        if path.endswith('.npz'):
+            counts = [len(scores) for _, _, scores in predictions]
+            np.savez(
+                path,
+                image_paths=np.array(image_paths),
+                offsets=np.concatenate([[0], np.cumsum(counts)]),
+                boxes=np.concatenate(
+                    [np.reshape(p[0], (-1, 4)) for p in predictions] +
+                    [np.zeros((0, 4))]
+                ),
+                box_classes=np.concatenate(
+                    [p[1] for p in predictions] + [np.zeros(0, dtype=int)]
+                ),
+                box_scores=np.concatenate(
+                    [p[2] for p in predictions] + [np.zeros(0)]
+                ),
+                class_names=np.array(self.class_names)
             )
+            return
 
-            # Use only the filename (not the full path) as the window name
-            file_name = os.path.basename(image_paths[i])
+        manifest = [
+            dict(image=image_path, **self.detections(*prediction))
+            for image_path, prediction in zip(image_paths, predictions)
+        ]
+        with open(path, 'w') as f:
+            json.dump(manifest, f, indent=1)
 
-            self.show_boxes(image, boxes, box_classes, box_scores, file_name)
+    def predict(self, folder_path, headless=False, output_dir='detections',
+                manifest=None, writers=2, letterbox=False):
+        """Run the full YOLO prediction pipeline on all images in a folder.
+
+        Args:
+            folder_path (str): Path to the folder holding all images
+                to predict.
+            headless (bool): Skip the GUI: instead of showing every image
+                with show_boxes, annotated images are written to
+                output_dir by background writer threads and the
+                detections to a manifest.
+            output_dir (str): Folder for the annotated images in
+                headless mode.
+            manifest (str): Manifest path in headless mode (.json or
+                .npz). Defaults to manifest.json in output_dir.
+            writers (int): Number of background writer threads.
+            letterbox (bool): Letterbox the images instead of stretching
+                them to the model input (see preprocess_images).
 
-            predictions.append((boxes, box_classes, box_scores))
+        Returns:
+            tuple: (predictions, image_paths)
+                predictions: list of tuples (boxes, box_classes, box_scores)
+                    for each image.
+                image_paths: list of image paths corresponding to each
+                    prediction in predictions.
+        """
+        predictions = []
+        image_paths = []
+
+        def write(image, prediction, file_name, batch_index):
+            """Annotate, encode and write one image."""
+            with self._stage('render', batch=batch_index):
+                annotated = self.draw_boxes(image, *prediction)
+                cv2.imwrite(os.path.join(output_dir, file_name), annotated)
+
+        if headless:
+            os.makedirs(output_dir, exist_ok=True)
+        executor = ThreadPoolExecutor(max_workers=writers)
+        pending = deque()
+
+        try:
+            for image_path, image, prediction in self.predict_iter(
+                    folder_path, letterbox=letterbox):
+                # Use only the filename (not the full path) as the window
+                # name and output file name
+                file_name = os.path.basename(image_path)
+
+                if headless:
+                    # Wait for the oldest writes when the writers fall
+                    # behind, so images don't pile up in memory
+                    while len(pending) >= 4 * writers:
+                        pending.popleft().result()
+                    pending.append(executor.submit(
+                        write, image, prediction, file_name,
+                        None if self.profiler is None
+                        else self.profiler.batch
+                    ))
+                else:
+                    with self._stage('render'):
+                        self.show_boxes(image, *prediction, file_name)
+
+                predictions.append(prediction)
+                image_paths.append(image_path)
+
+            while pending:
+                pending.popleft().result()
+        finally:
+            executor.shutdown(wait=True)
+
+        if headless:
+            if manifest is None:
+                manifest = os.path.join(output_dir, 'manifest.json')
+            self.write_manifest(manifest, predictions, image_paths)
 
         return predictions, image_paths
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""Benchmarks for the Yolo post-processing.
+
+Run `./benchmark.py` to time non-max suppression on synthetic crowded
+scenes of thousands of candidate boxes, the per-image latency of the
+float32 process_outputs against the float64 decoder it replaced, and
+the fused filter_batch against process_outputs + filter_boxes. The fast
+paths are checked against the reference ones. No model is needed.
+"""
+
+import argparse
+from types import SimpleNamespace
+import time
+import numpy as np
+Yolo = __import__('7-yolo').Yolo
+sigmoid = __import__('7-yolo').sigmoid
+ANCHORS = __import__('7-yolo').ANCHORS
+
+SCENES = [
+    # (candidate boxes, classes, objects)
+    (500, 3, 20),
+    (2000, 5, 50),
+    (5000, 10, 100),
+    (10000, 20, 200),
+]
+
+
+def time_op(fn, repeat=5):
+    """Best wall time of fn() over `repeat` runs, after one warm-up run.
+
+    Args:
+        fn (callable): Function without arguments.
+        repeat (int): Number of timed runs.
+
+    Returns:
+        float: Time in seconds.
+    """
+    fn()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def bare_yolo(class_t=0.6, nms_t=0.5, input_size=416, classes=80):
+    """Yolo instance without a model, for the post-processing methods.
+
+    Args:
+        class_t (float): Box score threshold.
+        nms_t (float): IOU threshold.
+        input_size (int): Side of the (square) model input.
+        classes (int): Number of classes.
+
+    Returns:
+        Yolo: Instance whose model only has an input shape.
+    """
+    yolo = Yolo.__new__(Yolo)
+    yolo.model = SimpleNamespace(
+        input=SimpleNamespace(shape=(None, input_size, input_size, 3))
+    )
+    yolo.class_names = [str(c) for c in range(classes)]
+    yolo.class_t = class_t
+    yolo.nms_t = nms_t
+    yolo.anchors = ANCHORS
+    yolo.profiler = None
+
+    return yolo
+
+
+def crowded_scene(n, classes, objects, size=416, seed=0):
+    """Candidate boxes clustered around objects, as a detector emits them.
+
+    Args:
+        n (int): Number of candidate boxes.
+        classes (int): Number of classes.
+        objects (int): Number of objects the candidates jitter around.
+        size (int): Side of the image in pixels.
+        seed (int): Seed of the generator.
+
+    Returns:
+        tuple: (boxes, box_classes, box_scores) shaped like the output
+            of filter_boxes.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.random((objects, 2)) * size
+    sides = rng.random((objects, 2)) * size / 4 + 8
+    object_classes = rng.integers(0, classes, objects)
+
+    owner = rng.integers(0, objects, n)
+    jitter = 1 + rng.normal(0, 0.15, (n, 4))
+    center = centers[owner] + sides[owner] * rng.normal(0, 0.1, (n, 2))
+    half = sides[owner] / 2
+    boxes = np.concatenate([center - half * jitter[:, :2],
+                            center + half * jitter[:, 2:]], axis=1)
+
+    return boxes, object_classes[owner], rng.random(n)
+
+
+def bench_nms(n, classes, objects, nms_t=0.5, repeat=5):
+    """Times both NMS methods on one scene and checks they agree.
+
+    Args:
+        n (int): Number of candidate boxes.
+        classes (int): Number of classes.
+        objects (int): Number of objects in the scene.
+        nms_t (float): IOU threshold.
+        repeat (int): Number of timed runs.
+
+    Returns:
+        dict: Scene size, kept boxes and the time of each method.
+    """
+    yolo = bare_yolo(nms_t=nms_t)
+    scene = crowded_scene(n, classes, objects)
+
+    results = {}
+    for method in ("loop", "vectorized"):
+        results[method] = yolo.non_max_suppression(*scene, method=method)
+    for ours, reference in zip(results["vectorized"], results["loop"]):
+        if not np.array_equal(ours, reference):
+            raise AssertionError("vectorized NMS differs from the loop")
+
+    return {
+        'n': n,
+        'classes': classes,
+        'kept': len(results["loop"][2]),
+        'loop': time_op(lambda: yolo.non_max_suppression(
+            *scene, method="loop"), repeat),
+        'vectorized': time_op(lambda: yolo.non_max_suppression(
+            *scene, method="vectorized"), repeat)
+    }
+
+
+def reference_process_outputs(yolo, outputs, image_size):
+    """process_outputs as it was before the float32 decoder (float64).
+
+    Args:
+        yolo (Yolo): Instance providing the anchors and input size.
+        outputs (list): Predictions of one image, one per output scale.
+        image_size (numpy.ndarray): [image_height, image_width].
+
+    Returns:
+        tuple: (boxes, box_confidences, box_class_probs)
+    """
+    boxes = []
+    box_confidences = []
+    box_class_probs = []
+    image_height, image_width = image_size
+    input_width = yolo.model.input.shape[1]
+    input_height = yolo.model.input.shape[2]
+
+    for i, output in enumerate(outputs):
+        grid_height, grid_width, _, _ = output.shape
+        cx = np.arange(grid_width).reshape(1, grid_width, 1)
+        cy = np.arange(grid_height).reshape(grid_height, 1, 1)
+
+        bx = (sigmoid(output[..., 0]) + cx) / grid_width
+        by = (sigmoid(output[..., 1]) + cy) / grid_height
+        bw = (yolo.anchors[i, :, 0] * np.exp(output[..., 2])) / input_width
+        bh = (yolo.anchors[i, :, 1] * np.exp(output[..., 3])) / input_height
+
+        boxes.append(np.stack([
+            (bx - bw / 2) * image_width, (by - bh / 2) * image_height,
+            (bx + bw / 2) * image_width, (by + bh / 2) * image_height
+        ], axis=-1))
+        box_confidences.append(sigmoid(output[..., 4:5]))
+        box_class_probs.append(sigmoid(output[..., 5:]))
+
+    return boxes, box_confidences, box_class_probs
+
+
+def bench_decode(input_size=416, classes=80, repeat=20, seed=0):
+    """Per-image latency of process_outputs against the float64 decoder.
+
+    The gain comes from decoding in float32 with in-place operations
+    instead of float64 temporaries and np.stack; with 80 classes most
+    of the time goes to the class sigmoids either way.
+
+    Args:
+        input_size (int): Side of the model input; the grids are 1/32,
+            1/16 and 1/8 of it.
+        classes (int): Number of classes.
+        repeat (int): Number of timed runs.
+        seed (int): Seed of the synthetic predictions.
+
+    Returns:
+        dict: Times of the float64 reference decoder and of
+            process_outputs (float32).
+    """
+    rng = np.random.default_rng(seed)
+    yolo = bare_yolo(input_size=input_size, classes=classes)
+    outputs = [
+        rng.standard_normal((input_size // stride, input_size // stride,
+                             3, 5 + classes)).astype(np.float32)
+        for stride in (32, 16, 8)
+    ]
+    image_size = np.array([480, 640])
+
+    ours = yolo.process_outputs(outputs, image_size)
+    reference = reference_process_outputs(yolo, outputs, image_size)
+    for a, b in zip(ours[0], reference[0]):
+        if not np.allclose(a, b, rtol=1e-5, atol=1e-2):
+            raise AssertionError("float32 decoder differs from the reference")
+
+    return {
+        'input': input_size,
+        'float64': time_op(lambda: reference_process_outputs(
+            yolo, outputs, image_size), repeat),
+        'float32': time_op(lambda: yolo.process_outputs(outputs, image_size),
+                           repeat)
+    }
+
+
+def bench_filter(batch=16, input_size=416, classes=80, bias=-1.5,
+                 repeat=5, seed=0):
+    """Per-image time of the fused filter_batch against the three-method path.
+
+    Args:
+        batch (int): Number of images.
+        input_size (int): Side of the model input.
+        classes (int): Number of classes.
+        bias (float): Shift of the confidence and class logits; the
+            default leaves a realistic fraction of boxes above class_t.
+        repeat (int): Number of timed runs.
+        seed (int): Seed of the synthetic predictions.
+
+    Returns:
+        dict: Kept boxes and the per-image time of each path.
+    """
+    rng = np.random.default_rng(seed)
+    yolo = bare_yolo(input_size=input_size, classes=classes)
+    outputs = []
+    for stride in (32, 16, 8):
+        output = rng.standard_normal(
+            (batch, input_size // stride, input_size // stride, 3,
+             5 + classes)
+        ).astype(np.float32)
+        output[..., 4:] += bias
+        outputs.append(output)
+    image_shapes = np.tile([[480, 640]], (batch, 1))
+
+    def separate():
+        """process_outputs and filter_boxes, image by image."""
+        return [
+            yolo.filter_boxes(*yolo.process_outputs(
+                [output[i] for output in outputs], image_shapes[i]
+            ))
+            for i in range(batch)
+        ]
+
+    fused = yolo.filter_batch(outputs, image_shapes)
+    if not np.array_equal(np.concatenate([r[2] for r in separate()]),
+                          fused[2]):
+        raise AssertionError("filter_batch differs from filter_boxes")
+
+    return {
+        'kept': len(fused[2]) / batch,
+        'separate': time_op(separate, repeat) / batch,
+        'fused': time_op(lambda: yolo.filter_batch(outputs, image_shapes),
+                         repeat) / batch
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nms-t', type=float, default=0.5,
+                        help="IOU threshold of the suppression")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="timed runs per measurement (best is kept)")
+    args = parser.parse_args()
+
+    print("{:>7} {:>7} {:>6} {:>10} {:>12} {:>8}".format(
+        'boxes', 'classes', 'kept', 'loop (ms)', 'vector (ms)', 'speedup'
+    ))
+    for n, classes, objects in SCENES:
+        row = bench_nms(n, classes, objects, args.nms_t, args.repeat)
+        print("{:>7} {:>7} {:>6} {:>10.2f} {:>12.2f} {:>7.1f}x".format(
+            row['n'], row['classes'], row['kept'], row['loop'] * 1e3,
+            row['vectorized'] * 1e3, row['loop'] / row['vectorized']
+        ))
+
+    print()
+    print("{:>7} {:>13} {:>13} {:>8}".format(
+        'input', 'float64 (ms)', 'float32 (ms)', 'speedup'
+    ))
+    for input_size in (320, 416, 608):
+        row = bench_decode(input_size, repeat=args.repeat)
+        print("{:>7} {:>13.3f} {:>13.3f} {:>7.1f}x".format(
+            row['input'], row['float64'] * 1e3, row['float32'] * 1e3,
+            row['float64'] / row['float32']
+        ))
+
+    print()
+    row = bench_filter(repeat=args.repeat)
+    print("decode + filter per image: {:.2f} ms separately, {:.2f} ms "
+          "fused ({:.1f}x, {:.0f} boxes kept)".format(
+              row['separate'] * 1e3, row['fused'] * 1e3,
+              row['separate'] / row['fused'], row['kept']))
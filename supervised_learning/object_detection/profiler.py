@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Opt-in per-stage profiler for the Yolo pipeline.
+
+    yolo.profiler = Profiler()
+    yolo.predict('images', headless=True)
+    print(yolo.profiler.summary())
+    yolo.profiler.export('trace.json', chrome=True)
+
+The chrome=True export opens in chrome://tracing or ui.perfetto.dev.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# Stages of Yolo.predict, in pipeline order
+STAGES = ('load', 'preprocess', 'infer', 'filter_batch',
+          'non_max_suppression', 'render')
+
+
+class Profiler:
+    """Records the wall time, item count and peak memory of every stage."""
+
+    def __init__(self, memory=True):
+        """Initialize Profiler instance.
+
+        Args:
+            memory (bool): Track the peak memory of every stage with
+                tracemalloc. It is global to the process, so a stage
+                is charged for whatever other threads allocate while it
+                runs, and it slows down allocations.
+        """
+        self.memory = memory
+        self.events = []
+        self.batch = None
+        self.lock = threading.Lock()
+        # Peak traced memory seen by each running stage, since
+        # tracemalloc has only one peak to reset
+        self.open = {}
+        self.started = False
+        self.origin = time.perf_counter()
+
+    def _fold_peak(self):
+        """Credit the peak since the last reset to the running stages.
+
+        Must be called with the lock held.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        for key, seen in self.open.items():
+            self.open[key] = max(seen, peak)
+        tracemalloc.reset_peak()
+
+        return current
+
+    @contextmanager
+    def stage(self, name, items=1, batch=None):
+        """Time one run of a stage.
+
+        Args:
+            name (str): Stage name.
+            items (int): Number of images the run handles.
+            batch (int): Batch the run belongs to. Defaults to
+                self.batch, which Yolo.predict_iter keeps up to date.
+        """
+        if batch is None:
+            batch = self.batch
+        key = object()
+        start_memory = 0
+        if self.memory:
+            with self.lock:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self.started = True
+                start_memory = self._fold_peak()
+                self.open[key] = start_memory
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                peak = None
+                if self.memory:
+                    self._fold_peak()
+                    peak = self.open.pop(key) - start_memory
+                self.events.append({
+                    'stage': name,
+                    'batch': batch,
+                    'items': items,
+                    'start': start - self.origin,
+                    'duration': end - start,
+                    'peak_memory': peak,
+                    'thread': threading.current_thread().name
+                })
+
+    def stages(self):
+        """Aggregate the events by stage.
+
+        Returns:
+            list: One dict per stage, pipeline stages first: calls,
+                items, total and mean time per item in seconds, items
+                per second, and largest peak memory in bytes.
+        """
+        with self.lock:
+            events = list(self.events)
+
+        names = [name for name in STAGES
+                 if any(e['stage'] == name for e in events)]
+        names += sorted({e['stage'] for e in events} - set(STAGES))
+
+        rows = []
+        for name in names:
+            runs = [e for e in events if e['stage'] == name]
+            total = sum(e['duration'] for e in runs)
+            items = sum(e['items'] for e in runs)
+            peaks = [e['peak_memory'] for e in runs
+                     if e['peak_memory'] is not None]
+            rows.append({
+                'stage': name,
+                'calls': len(runs),
+                'items': items,
+                'total': total,
+                'per_item': total / items if items else None,
+                'throughput': items / total if total else None,
+                'peak_memory': max(peaks) if peaks else None
+            })
+
+        return rows
+
+    def batches(self):
+        """Time of every stage in every batch.
+
+        Returns:
+            list: One dict per batch, in batch order: the batch index
+                and the total seconds of each stage it went through.
+        """
+        with self.lock:
+            events = list(self.events)
+
+        batches = {}
+        for e in events:
+            if e['batch'] is None:
+                continue
+            times = batches.setdefault(e['batch'], {})
+            times[e['stage']] = times.get(e['stage'], 0) + e['duration']
+
+        return [dict(batch=batch, **batches[batch])
+                for batch in sorted(batches)]
+
+    def summary(self):
+        """Summary table of the stages.
+
+        Times are summed over all threads, so stages run by thread pools
+        (load, preprocess, render) can add up to more than the wall time
+        of the run.
+
+        Returns:
+            str: One line per stage.
+        """
+        lines = ["{:<20} {:>6} {:>7} {:>10} {:>10} {:>10} {:>9}".format(
+            'stage', 'calls', 'items', 'total (s)', 'ms/item', 'items/s',
+            'peak (MB)'
+        )]
+        for row in self.stages():
+            lines.append(
+                "{:<20} {:>6} {:>7} {:>10.3f} {:>10} {:>10} {:>9}".format(
+                    row['stage'], row['calls'], row['items'], row['total'],
+                    '-' if row['per_item'] is None
+                    else '{:.2f}'.format(row['per_item'] * 1e3),
+                    '-' if row['throughput'] is None
+                    else '{:.1f}'.format(row['throughput']),
+                    '-' if row['peak_memory'] is None
+                    else '{:.1f}'.format(row['peak_memory'] / 2 ** 20)
+                )
+            )
+
+        return '\n'.join(lines)
+
+    def export(self, path, chrome=False):
+        """Write the events to a JSON file.
+
+        Args:
+            path (str): Output file.
+            chrome (bool): Write the Chrome trace event format instead
+                of {'stages': ..., 'batches': ..., 'events': ...}.
+        """
+        with self.lock:
+            events = list(self.events)
+
+        if not chrome:
+            data = {'stages': self.stages(), 'batches': self.batches(),
+                    'events': events}
+        else:
+            pid = os.getpid()
+            threads = {name: tid for tid, name in enumerate(
+                sorted({e['thread'] for e in events}))}
+            data = {'traceEvents': [
+                {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                 'args': {'name': name}}
+                for name, tid in threads.items()
+            ] + [
+                {'name': e['stage'], 'cat': 'yolo', 'ph': 'X', 'pid': pid,
+                 'tid': threads[e['thread']], 'ts': e['start'] * 1e6,
+                 'dur': e['duration'] * 1e6,
+                 'args': {'batch': e['batch'], 'items': e['items'],
+                          'peak_memory': e['peak_memory']}}
+                for e in events
+            ]}
+
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=1)
+
+    def close(self):
+        """Stop tracemalloc if the profiler started it."""
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""Local HTTP inference server for Yolo.
+
+The model is loaded once. Concurrent requests are coalesced into
+micro-batches: a batch is sent to the model as soon as it holds
+max_batch images, or when its oldest image has waited max_latency.
+
+    ./server.py yolo.h5 coco_classes.txt --port 8000
+    curl --data-binary @dog.jpg http://127.0.0.1:8000/detect
+    curl http://127.0.0.1:8000/stats
+
+POST /detect takes an encoded image (any format cv2.imdecode reads) and
+returns its detections as JSON. GET /stats returns the queue depth, the
+batch sizes and the p50/p99 latency.
+"""
+
+import argparse
+from collections import Counter, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import queue
+import threading
+import time
+import numpy as np
+import cv2
+Yolo = __import__('7-yolo').Yolo
+ANCHORS = __import__('7-yolo').ANCHORS
+
+
+class MicroBatcher:
+    """Runs Yolo on micro-batches of the images submitted by any thread."""
+
+    def __init__(self, yolo, max_batch=16, max_latency=0.01,
+                 letterbox=False, window=1000):
+        """Initialize MicroBatcher instance and start its model thread.
+
+        Args:
+            yolo (Yolo): Detector whose model runs the batches.
+            max_batch (int): Largest number of images per batch; the
+                model is always fed max_batch images (zero-padded).
+            max_latency (float): Longest time in seconds an image waits
+                for its batch to fill up.
+            letterbox (bool): Letterbox the images (see
+                Yolo.preprocess_images).
+            window (int): Number of latest requests the latency
+                percentiles are computed over.
+        """
+        self.yolo = yolo
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.letterbox = letterbox
+
+        self.input_h = yolo.model.input.shape[1]
+        self.input_w = yolo.model.input.shape[2]
+        self.pimages = np.zeros(
+            (max_batch, self.input_h, self.input_w, 3),
+            dtype=yolo.model.input.dtype
+        )
+
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = Counter()
+        self.served = 0
+        self.failed = 0
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image):
+        """Queue one image for detection.
+
+        The image is resized in the calling thread, so request threads
+        share the preprocessing while the model thread only runs
+        batches.
+
+        Args:
+            image (numpy.ndarray): Image as read by cv2.imread.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the
+                (boxes, box_classes, box_scores) tuple of Yolo.predict.
+        """
+        future = Future()
+        with self.yolo._stage('preprocess'):
+            resized = self.yolo._resize_image(image, self.input_h,
+                                              self.input_w, self.letterbox)
+        self.requests.put(
+            (time.perf_counter(), image.shape[:2], resized, future)
+        )
+
+        return future
+
+    def _next_batch(self):
+        """Wait for a request, then gather more until the batch is full
+        or the first request has waited max_latency.
+
+        Returns:
+            list: Queued requests, or None once the batcher is closed.
+        """
+        first = self.requests.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = first[0] + self.max_latency
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout > 0:
+                    request = self.requests.get(timeout=timeout)
+                else:
+                    request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # Serve what we have, then stop on the next call
+                self.requests.put(None)
+                break
+            batch.append(request)
+
+        return batch
+
+    def _run(self):
+        """Model thread: runs the batches until close() is called."""
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                predictions = self._predict(batch)
+            except Exception as e:
+                for _, _, _, future in batch:
+                    future.set_exception(e)
+                with self.lock:
+                    self.failed += len(batch)
+                continue
+
+            done = time.perf_counter()
+            for (_, _, _, future), prediction in zip(batch, predictions):
+                future.set_result(prediction)
+            with self.lock:
+                self.latencies.extend(done - arrival
+                                      for arrival, _, _, _ in batch)
+                self.batch_sizes[len(batch)] += 1
+                self.served += len(batch)
+
+    def _predict(self, batch):
+        """Run the model and the post-processing on one batch.
+
+        Args:
+            batch (list): Queued requests.
+
+        Returns:
+            list: (boxes, box_classes, box_scores) of every request.
+        """
+        n = len(batch)
+        with self.yolo._stage('infer', n):
+            for k, (_, _, resized, _) in enumerate(batch):
+                self.yolo._normalize(resized, self.pimages[k])
+            self.pimages[n:] = 0
+            # Always the full buffer: a new batch size would make Keras
+            # retrace the model. predict_on_batch skips the tf.data
+            # pipeline predict builds on every call
+            model_outputs = self.yolo.model.predict_on_batch(self.pimages)
+        image_shapes = np.array([shape for _, shape, _, _ in batch])
+        with self.yolo._stage('filter_batch', n):
+            filtered_boxes, box_classes, box_scores, offsets = (
+                self.yolo.filter_batch(
+                    [out[:n] for out in model_outputs], image_shapes,
+                    self.letterbox
+                )
+            )
+
+        predictions = []
+        with self.yolo._stage('non_max_suppression', n):
+            for i in range(n):
+                start, end = offsets[i], offsets[i + 1]
+                predictions.append(self.yolo.non_max_suppression(
+                    filtered_boxes[start:end], box_classes[start:end],
+                    box_scores[start:end]
+                ))
+
+        return predictions
+
+    def stats(self):
+        """Snapshot of the queue and of the served batches.
+
+        Returns:
+            dict: queue_depth, served and failed requests, batches,
+                mean_batch_size, batch_sizes (histogram), and the p50
+                and p99 latency in milliseconds over the latest
+                requests, from submission to result.
+        """
+        with self.lock:
+            latencies = np.array(self.latencies) * 1e3
+            batch_sizes = dict(sorted(self.batch_sizes.items()))
+            served, failed = self.served, self.failed
+
+        batches = sum(batch_sizes.values())
+        if len(latencies):
+            p50, p99 = np.percentile(latencies, [50, 99]).tolist()
+        else:
+            p50 = p99 = None
+
+        return {
+            'queue_depth': self.requests.qsize(),
+            'served': served,
+            'failed': failed,
+            'batches': batches,
+            'mean_batch_size': served / batches if batches else None,
+            'batch_sizes': batch_sizes,
+            'latency_ms': {'p50': p50, 'p99': p99},
+            'max_batch': self.max_batch,
+            'max_latency_ms': self.max_latency * 1e3
+        }
+
+    def close(self):
+        """Serve the queued requests, then stop the model thread."""
+        self.requests.put(None)
+        self.thread.join()
+
+
+class DetectionHandler(BaseHTTPRequestHandler):
+    """HTTP front end of the MicroBatcher held by the server."""
+
+    def send_json(self, code, payload):
+        """Send a JSON response.
+
+        Args:
+            code (int): HTTP status code.
+            payload: JSON-serializable body.
+        """
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """GET /stats: batcher statistics."""
+        if self.path == '/stats':
+            self.send_json(200, self.server.batcher.stats())
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        """POST /detect: detections of the encoded image in the body."""
+        if self.path != '/detect':
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        data = np.frombuffer(self.rfile.read(length), dtype=np.uint8)
+        image = cv2.imdecode(data, cv2.IMREAD_COLOR) if length else None
+        if image is None:
+            self.send_json(400, {'error': 'body is not an image'})
+            return
+
+        try:
+            prediction = self.server.batcher.submit(image).result()
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+            return
+        self.send_json(200, self.server.batcher.yolo.detections(
+            *prediction
+        ))
+
+    def log_message(self, format, *args):
+        """Log requests only when the server is verbose."""
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(yolo, host='127.0.0.1', port=8000, max_batch=16,
+          max_latency=0.01, letterbox=False, verbose=False):
+    """Serve detections over HTTP until interrupted.
+
+    Args:
+        yolo (Yolo): Detector, loaded once for all requests.
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        max_batch (int): Largest number of images per model call.
+        max_latency (float): Longest time in seconds an image waits
+            for its batch to fill up.
+        letterbox (bool): Letterbox the images.
+        verbose (bool): Log every request.
+    """
+    server = ThreadingHTTPServer((host, port), DetectionHandler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    server.batcher = MicroBatcher(yolo, max_batch, max_latency, letterbox)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('model', help="path to the Darknet Keras model")
+    parser.add_argument('classes', help="path to the class names")
+    parser.add_argument('--class-t', type=float, default=0.6,
+                        help="box score threshold")
+    parser.add_argument('--nms-t', type=float, default=0.5,
+                        help="IOU threshold of the suppression")
+    parser.add_argument('--anchors',
+                        help=".npy file of anchor boxes (default: the "
+                        "YOLO v3 COCO anchors)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch', type=int, default=16,
+                        help="largest number of images per model call")
+    parser.add_argument('--max-latency-ms', type=float, default=10,
+                        help="longest wait for a batch to fill up")
+    parser.add_argument('--letterbox', action='store_true',
+                        help="keep the aspect ratio of the images")
+    parser.add_argument('--verbose', action='store_true',
+                        help="log every request")
+    args = parser.parse_args()
+
+    anchors = ANCHORS if args.anchors is None else np.load(args.anchors)
+    yolo = Yolo(args.model, args.classes, args.class_t, args.nms_t, anchors)
+    print("Serving on http://{}:{}".format(args.host, args.port))
+    serve(yolo, args.host, args.port, args.max_batch,
+          args.max_latency_ms / 1e3, args.letterbox, args.verbose)